@@ -0,0 +1,238 @@
+import copy
+import threading
+import numpy as np
+import pandas as pd
+from preprocessor import DAY_ORDER, MONTH_ORDER, PERIOD_LOOKUP
+from utils import (build_emoji_index, build_link_index, build_token_index, top_domains, top_emojis, top_words,
+                   wordcloud_frequencies)
+
+OVERALL = "Overall"
+
+def _add_tables(old, new):
+    # Sum two count tables with the same index levels (categorical levels may differ)
+    combined = pd.concat([old, new])
+    levels = list(range(combined.index.nlevels))
+    return combined.groupby(level=levels, observed=True, sort=False).sum()
+
+def _merge_index(old, new, offset):
+    new = new.assign(first=new['first'] + offset)
+    return pd.concat([old, new]).groupby(level=[0, 1], sort=False).agg(count=('count', 'sum'), first=('first', 'min'))
+
+# ---------------- ACTIVITY CUBE ----------------
+class ActivityCube:
+    # Messages per (user, day, hour) as one dense array covering every day from the first message
+    # to the last. Timelines, activity maps and the heatmap are reductions of a [start, end] slice.
+    def __init__(self, df, users):
+        self.users = list(users)
+        dates = df['date'][df['date'].notna()]
+        days = dates.dt.normalize()
+        self.start = days.min() if len(days) else None
+        n_days = (days.max() - self.start).days + 1 if len(days) else 0
+        user_pos = pd.Categorical(df['user'][dates.index], categories=self.users).codes.astype(np.int64)
+        day_pos = ((days - self.start) // pd.Timedelta(days=1)).to_numpy(dtype=np.int64) if len(days) else np.zeros(0, np.int64)
+        cells = day_pos * 24 + dates.dt.hour.to_numpy(dtype=np.int64)
+        # One user's day x hour plane at a time, so no int64 array of the whole cube is ever built
+        order = np.argsort(user_pos, kind='stable')
+        bounds = np.searchsorted(user_pos[order], np.arange(len(self.users) + 1))
+        self.counts = np.zeros((len(self.users), n_days, 24), dtype=np.uint16)
+        for row, (lo, hi) in enumerate(zip(bounds, bounds[1:])):
+            plane = np.bincount(cells[order[lo:hi]], minlength=n_days * 24).reshape(n_days, 24)
+            if hi > lo and plane.max() >= 2 ** 16 and self.counts.dtype == np.uint16:
+                self.counts = self.counts.astype(np.int32)
+            self.counts[row] = plane
+        self._set_days(n_days)
+
+    def _set_days(self, n_days):
+        # uint16 per cell unless someone really sent 65k messages in one hour; the Overall plane is int64
+        self.overall = self.counts.sum(axis=0, dtype=np.int64)
+        self.days = self.start + pd.to_timedelta(np.arange(n_days), unit='D') if n_days else pd.DatetimeIndex([])
+
+    def date_bounds(self):
+        # (first day, last day) with messages, or None for a chat without valid dates
+        if not len(self.days):
+            return None
+        return self.days[0].date(), self.days[-1].date()
+
+    def merged(self, other, users):
+        # Both cubes laid out on the union of users and days
+        starts = [cube.start for cube in (self, other) if cube.start is not None]
+        if not starts:
+            return copy.copy(other)
+        start = min(starts)
+        ends = [cube.days[-1] for cube in (self, other) if len(cube.days)]
+        # Cells of both cubes can add up (a tail continuing the last day), so widen only when they could overflow
+        peak = sum(int(cube.counts.max()) for cube in (self, other) if cube.counts.size)
+        counts = np.zeros((len(users), (max(ends) - start).days + 1, 24), dtype=np.uint16 if peak < 2 ** 16 else np.int32)
+        for cube in (self, other):
+            if not len(cube.days):
+                continue
+            offset = (cube.start - start).days
+            rows = [users.index(user) for user in cube.users]
+            counts[rows, offset:offset + len(cube.days)] += cube.counts
+        result = copy.copy(self)
+        result.users, result.start, result.counts = list(users), start, counts
+        result._set_days(counts.shape[1])
+        return result
+
+    def plane(self, user=OVERALL, start=None, end=None):
+        # (days, day x hour counts) for one user or everyone, limited to start..end (dates, inclusive)
+        if user == OVERALL:
+            counts = self.overall
+        elif user in self.users:
+            counts = self.counts[self.users.index(user)]
+        else:
+            counts = np.zeros((len(self.days), 24), dtype=np.int64)
+        first = 0 if start is None or self.start is None else max(0, (pd.Timestamp(start) - self.start).days)
+        last = len(self.days) if end is None or self.start is None else max(0, (pd.Timestamp(end) - self.start).days + 1)
+        return self.days[first:last], counts[first:last].astype(np.int64, copy=False)
+
+# ---------------- ALL-USERS AGGREGATES ----------------
+class ChatAggregates:
+    # Every per-user table is built in one grouped pass; "Overall" is the sum over users.
+    # Each accessor returns the same shape as the matching utils function.
+    def __init__(self, df):
+        self.users = sorted(df['user'].unique().tolist())
+        self._build_counts(df)
+        self.activity = ActivityCube(df, self.users)
+        # Token, emoji and link indexes need the message text, so they are built on first use.
+        # Worker threads may ask for several at once; each index has its own lock.
+        self._source = df[['user', 'message', 'url_count', 'is_media', 'is_deleted', 'is_system']]
+        self._indexes = {}
+        self._locks = {'words': threading.Lock(), 'emojis': threading.Lock(), 'links': threading.Lock()}
+
+    # ---------------- BUILD ----------------
+    def _build_counts(self, df):
+        # Sums of the per-message columns preprocess adds; no text is rescanned
+        counts = pd.DataFrame({
+            'user': df['user'],
+            'messages': 1,
+            'words': df['word_count'].astype('int64'),
+            'media': df['is_media'].astype('int64'),
+            'urls': df['url_count'].astype('int64'),
+        })
+        self.counts = counts.groupby('user', observed=True).sum()
+
+    def _index(self, name, build):
+        with self._locks[name]:
+            if name not in self._indexes:
+                self._indexes[name] = build(self._source)
+                if len(self._indexes) == len(self._locks):
+                    # Every index built: the message text is no longer needed
+                    self._source = None
+        return self._indexes[name]
+
+    @property
+    def words(self):
+        return self._index('words', build_token_index)
+
+    @property
+    def emojis(self):
+        return self._index('emojis', build_emoji_index)
+
+    @property
+    def links(self):
+        return self._index('links', build_link_index)
+
+    # ---------------- INCREMENTAL ----------------
+    def merged(self, df):
+        # Aggregates for this chat plus the appended rows in df; only df is scanned.
+        # Returns a new object, since the original may be shared through the cache.
+        tail = ChatAggregates(df)
+        # Source before indexes: a source of None guarantees every index is in the snapshot
+        source, indexes = self._source, dict(self._indexes)
+        result = copy.copy(self)
+        result._locks = {name: threading.Lock() for name in self._locks}
+        # Appended rows come after every stored token, so shift their first positions
+        result._indexes = {
+            name: _merge_index(index, getattr(tail, name), int(index['count'].sum())) for name, index in indexes.items()
+        }
+        # Indexes nobody has asked for yet stay lazy, over the old and new messages together
+        result._source = None if source is None else pd.concat([source, tail._source], ignore_index=True)
+        result.users = sorted(set(self.users) | set(tail.users))
+        result.counts = _add_tables(self.counts, tail.counts)
+        result.activity = self.activity.merged(tail.activity, result.users)
+        return result
+
+    # ---------------- LOOKUP ----------------
+    def stats(self, user=OVERALL):
+        totals = self.counts.sum() if user == OVERALL else self.counts.reindex([user]).fillna(0).iloc[0]
+        return (int(totals['messages']), int(totals['words']), int(totals['media']), int(totals['urls']))
+
+    def most_active_users(self):
+        user_counts = self.counts['messages'].sort_values(ascending=False, kind='stable')
+        user_counts = user_counts[user_counts > 0].rename('count')
+        top_users = user_counts.head(5)
+        user_percentage_df = (user_counts / user_counts.sum() * 100).round(2).reset_index()
+        user_percentage_df.columns = ['user', 'percentage']
+        return top_users, user_percentage_df
+
+    def most_common_words(self, user=OVERALL, top=50):
+        return top_words(self.words, None if user == OVERALL else user, top)
+
+    def word_frequencies(self, user=OVERALL, max_words=200):
+        # Word cloud input, from the same token index as the top-words table
+        return wordcloud_frequencies(self.words, None if user == OVERALL else user, max_words)
+
+    def emoji_stats(self, user=OVERALL, top=50):
+        return top_emojis(self.emojis, None if user == OVERALL else user, top)
+
+    def link_stats(self, user=OVERALL, top=20):
+        return top_domains(self.links, None if user == OVERALL else user, top)
+
+    # Timelines and activity maps accept an optional start/end date (inclusive)
+    def monthly_timeline(self, user=OVERALL, start=None, end=None):
+        days, counts = self.activity.plane(user, start, end)
+        per_day = counts.sum(axis=1)
+        if not per_day.any():
+            return pd.DataFrame()
+        # Months since the first day's January, so bincount sums every month in one pass
+        first_year = days[0].year
+        per_month = np.bincount((days.year - first_year) * 12 + days.month - 1, weights=per_day).astype(np.int64)
+        months = np.flatnonzero(per_month)
+        timeline = pd.DataFrame({
+            'year': (first_year + months // 12).astype(np.int16),
+            'month_num': (months % 12 + 1).astype(np.int8),
+            'month': pd.Categorical.from_codes(months % 12, categories=MONTH_ORDER),
+            'message': per_month[months],
+        })
+        timeline['time'] = timeline['month'].astype(str).str[:3] + "-" + timeline['year'].astype(str)
+        return timeline
+
+    def daily_timeline(self, user=OVERALL, start=None, end=None):
+        days, counts = self.activity.plane(user, start, end)
+        per_day = counts.sum(axis=1)
+        active = per_day > 0
+        if not active.any():
+            return pd.DataFrame()
+        return pd.DataFrame({'only_date': days[active], 'message': per_day[active]})
+
+    def week_activity_map(self, user=OVERALL, start=None, end=None):
+        days, counts = self.activity.plane(user, start, end)
+        per_day = counts.sum(axis=1)
+        if not per_day.any():
+            return pd.Series()
+        week = np.bincount(days.dayofweek, weights=per_day, minlength=7).astype(np.int64)
+        return pd.Series(week, index=pd.Index(DAY_ORDER, name='day_name'), name='count')
+
+    def month_activity_map(self, user=OVERALL, start=None, end=None):
+        days, counts = self.activity.plane(user, start, end)
+        per_day = counts.sum(axis=1)
+        if not per_day.any():
+            return pd.Series()
+        months = np.bincount(days.month - 1, weights=per_day, minlength=12).astype(np.int64)
+        return pd.Series(months, index=pd.Index(MONTH_ORDER, name='month'), name='count')
+
+    def activity_heatmap(self, user=OVERALL, start=None, end=None):
+        days, counts = self.activity.plane(user, start, end)
+        weekday = days.dayofweek
+        grid = np.stack([counts[weekday == day].sum(axis=0) for day in range(7)])
+        # Same shape as utils.activity_heatmap: only weekdays and hours that have messages,
+        # then every weekday in order, including its fill of 1 for weekdays without any
+        rows, cols = grid.sum(axis=1) > 0, grid.sum(axis=0) > 0
+        if not rows.any():
+            return pd.DataFrame()
+        periods = pd.CategoricalIndex(np.array(list(PERIOD_LOOKUP.values()))[cols],
+                                      categories=list(PERIOD_LOOKUP.values()), name='period')
+        user_heatmap = pd.DataFrame(grid[rows][:, cols], index=pd.Index(np.array(DAY_ORDER)[rows], name='day_name'),
+                                    columns=periods)
+        return user_heatmap.reindex(DAY_ORDER, fill_value=1)
@@ -1,13 +1,20 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import plotly.express as px # type: ignore
 import plotly.graph_objects as go # type: ignore
 import streamlit as st # type: ignore
-from preprocessor import preprocess
-from utils import (
-    fetch_stats, fetch_most_active_users, generate_wordcloud, 
-    fetch_most_common_words, fetch_emoji_stats, monthly_timeline, 
-    daily_timeline, week_activity_map, month_activity_map, activity_heatmap
-)
+from aggregates import ChatAggregates
+from cache import HEAD_BYTES, LRUCache, ParquetStore
+from dynamics import SESSION_GAP_MINUTES, SESSION_GAP_OPTIONS, ConversationDynamics
+from ingest import ChatSource, parse_source
+from instrumentation import Profiler
+from preprocessor import FRAME_VERSION, append_frames, parse_appended
+from search import InvertedIndex
+from sketch import APPROX_TOP_MB, TopItemsSketch
+from utils import TIMELINE_RESOLUTIONS, WORDCLOUD_WIDTHS, bounded_timeline, downsample_timeline, load_stop_words, render_wordcloud
 import emoji # type: ignore
 
 # Custom CSS for futuristic theme
@@ -104,42 +111,198 @@ st.set_page_config(
     page_icon="💬"
 )
 
+# Dashboard sections as (key, expander label, open on first view); closed sections cost nothing
+SECTIONS = [
+    ("matches", "🔎 Matching Messages", True),
+    ("top_users", "👥 Top Users", True),
+    ("wordcloud", "🌐 Word Cloud", True),
+    ("words", "📚 Top 20 Words", False),
+    ("emojis", "😊 Top 20 Emojis", False),
+    ("links", "🔗 Top Domains", False),
+    ("monthly", "📅 Monthly Timeline", True),
+    ("daily", "📆 Daily Timeline", False),
+    ("activity", "📊 Activity Map", False),
+    ("heatmap", "🔥 Activity Heatmap", False),
+    ("dynamics", "💬 Conversation Dynamics", False),
+]
+SECTION_WORKERS = 4
+# Search hits listed in the Matching Messages section
+MAX_MATCH_ROWS = 500
+
+@st.cache_resource
+def get_cache():
+    # One bounded cache shared by every session on this server
+    return LRUCache()
+
+@st.cache_resource
+def get_disk_store():
+    return ParquetStore(version=FRAME_VERSION)
+
+@st.cache_resource
+def get_executor():
+    # Shared worker pool for the slow sections (token index, emoji scan, word cloud)
+    return ThreadPoolExecutor(max_workers=SECTION_WORKERS)
+
+def is_approximate(source):
+    # Above CHAT_APPROX_MB the top words and emojis come from fixed-size sketches, not exact indexes
+    return source.size >= APPROX_TOP_MB * 1024 * 1024
+
+def parse_chat(source, chat_hash):
+    # A re-export of a stored chat only parses the appended tail; returns (frame, new rows or None, day_first).
+    # The text streams from the upload (or out of the zip) straight into the parser, never decoded whole;
+    # chats above PARALLEL_THRESHOLD are cut into byte ranges that worker processes decode and parse.
+    # Large chats fold each parsed batch into the top words/emojis sketch on the way.
+    progress = st.progress(0.0, text="Reading chat...")
+    def report(fraction):
+        progress.progress(fraction, text=f"Reading chat... {fraction:.0%}")
+    sketch = TopItemsSketch() if is_approximate(source) else None
+    try:
+        base = disk_store.find_base(source.read(0, HEAD_BYTES), source.size, source.hash)
+        if base is not None and source.read(base[1] - 1, 1) == b"\n":
+            base_hash, length, day_first = base
+            if day_first is None:
+                day_first = source.day_first()
+            old = profiler.call("disk_cache.load", disk_store.load, base_hash)
+            if old is not None:
+                # Extend the earlier export's sketch if it is still in memory; otherwise it is rebuilt from the frame
+                base_sketch = cache.get(("top_sketch", base_hash)) if sketch is not None else None
+                sketch = base_sketch.copy() if base_sketch is not None else None
+                # The tail is read with the stored chat's date order
+                new = profiler.call(
+                    "preprocess.tail", parse_appended, old, source.lines(length, report), compact=True,
+                    on_batch=sketch.update if sketch is not None else None, day_first=day_first
+                )
+                if new is not None:
+                    if sketch is not None:
+                        cache.put(("top_sketch", chat_hash), sketch)
+                    return append_frames(old, new), (base_hash, new[new['user'] != 'Group_Message']), day_first
+                sketch = TopItemsSketch() if is_approximate(source) else None
+        day_first = profiler.call("day_order", source.day_first)
+        df = profiler.call(
+            "preprocess", parse_source, source, day_first, progress=report, compact=True,
+            on_batch=sketch.update if sketch is not None else None
+        )
+        if sketch is not None:
+            cache.put(("top_sketch", chat_hash), sketch)
+        return df, None, day_first
+    finally:
+        progress.empty()
+
+def load_chat(source, chat_hash):
+    # Repeat uploads load the stored columnar frame instead of re-running the parser
+    df = profiler.call("disk_cache.load", disk_store.load, chat_hash)
+    appended = None
+    if df is None:
+        df, appended, day_first = parse_chat(source, chat_hash)
+        profiler.call("disk_cache.save", disk_store.save, chat_hash, df)
+        disk_store.remember(source.read(0, HEAD_BYTES), source.size, chat_hash, day_first)
+    return df.empty, df[df['user'] != 'Group_Message'], appended
+
+def build_aggregates(df, appended):
+    # Extend the earlier export's cached aggregates with the appended rows when they are still in memory
+    if appended is not None:
+        base_hash, new_rows = appended
+        previous = cache.get(("aggregates", base_hash))
+        if previous is not None:
+            return previous.merged(new_rows)
+    return ChatAggregates(df)
+
+cache = get_cache()
+disk_store = get_disk_store()
+executor = get_executor()
+
 # Sidebar
 with st.sidebar:
     st.markdown("<h2 style='text-align: center;'>💬 Chat Analyzer</h2>", unsafe_allow_html=True)
-    uploaded_file = st.file_uploader("📁 Upload file", type=["txt"], key="file_uploader")
+    uploaded_file = st.file_uploader(
+        "📁 Upload file", type=["txt", "zip"], key="file_uploader", help="The exported .txt, or the .zip WhatsApp shares"
+    )
+    diagnostics = st.checkbox("🩺 Diagnostics", key="diagnostics", help="Show time, memory and rows per step")
+
+# Per-run stage timings; memory is only traced while the diagnostics panel is on
+profiler = Profiler(track_memory=diagnostics)
 
 # File loading
 USE_LOCAL_FILE = False
-chat_data = None
-if uploaded_file is not None:
-    chat_data = uploaded_file.read().decode("utf-8")
-    USE_LOCAL_FILE = False
-elif USE_LOCAL_FILE:
-    try:
-        with open("xyz.txt", "r", encoding="utf-8") as file:
-            chat_data = file.read()
-    except FileNotFoundError:
-        st.sidebar.error("❌ 'chat_data.txt' not found.")
+source = None
+try:
+    if uploaded_file is not None:
+        source = ChatSource(uploaded_file, uploaded_file.name)
+        upload_id = uploaded_file.file_id
+        USE_LOCAL_FILE = False
+    elif USE_LOCAL_FILE:
+        try:
+            with open("xyz.txt", "rb") as file:
+                source = ChatSource(io.BytesIO(file.read()), "xyz.txt")
+            upload_id = ("xyz.txt", os.path.getmtime("xyz.txt"))
+        except FileNotFoundError:
+            st.sidebar.error("❌ 'chat_data.txt' not found.")
+except (ValueError, zipfile.BadZipFile) as error:
+    st.sidebar.error(f"❌ {error}")
+if source is not None and source.media_files:
+    st.sidebar.caption(f"📎 {source.media_files:,} media files in the archive (not extracted)")
 
 # Main app
 st.markdown("<h1 style='text-align: center;'>📊 WhatsApp Chat Analyzer</h1>", unsafe_allow_html=True)
 
-if chat_data:
-    df = preprocess(chat_data)
-    if df.empty:
-        st.error("⚠️ No valid messages found. Expected format: 'DD/MM/YYYY, HH:MM AM/PM - User: Message'")
+if source is not None and source.size:
+    if not load_stop_words():
+        st.warning("⚠️ stop_words.txt not found. Proceeding without stop words.")
+    # Hashing a zipped chat means inflating it, so it happens once per upload rather than on every rerun
+    chat_hash = cache.get_or_compute(("upload", upload_id), source.hash)
+    profiler.context["chat"] = chat_hash[:12]
+    with profiler.stage("load_chat") as record:
+        no_messages, df, appended = cache.get_or_compute(("chat", chat_hash), load_chat, source, chat_hash)
+        record["rows"] = len(df)
+    if no_messages:
+        st.error("⚠️ No valid messages found. Expected lines like 'DD/MM/YYYY, HH:MM AM/PM - User: Message' or '[DD/MM/YY, HH:MM:SS] User: Message'")
     else:
-        df = df[df['user'] != 'Group_Message']
         if df.empty:
             st.warning("⚠️ All messages are group notifications. No user messages found.")
         
+        # Every user's tables are computed once per chat; switching users is a lookup
+        aggregates = profiler.call("aggregates", cache.get_or_compute, ("aggregates", chat_hash), build_aggregates, df, appended)
+        
         # User filter
         with st.sidebar:
-            unique_users = df['user'].unique().tolist()
-            unique_users.sort()
+            unique_users = list(aggregates.users)
             unique_users.insert(0, "Overall")
             selected_user = st.selectbox("👤 Select user", unique_users, key="user_select")
+            profiler.context["user"] = selected_user
+            # Timelines and activity maps re-slice the activity cube, so narrowing the range is instant
+            date_bounds = aggregates.activity.date_bounds()
+            start_date = end_date = None
+            if date_bounds:
+                picked = st.date_input(
+                    "📆 Date range", value=date_bounds, min_value=date_bounds[0], max_value=date_bounds[1],
+                    key=f"date_range_{chat_hash[:12]}", help="Applies to timelines and activity maps"
+                )
+                # Mid-selection the widget holds only the start date
+                start_date, end_date = (tuple(picked) + (date_bounds[1],))[:2]
+            query = st.text_input(
+                "🔎 Search messages", key=f"search_{chat_hash[:12]}", placeholder='words or "exact phrase"',
+                help="Limits every section to messages containing all the words and phrases"
+            ).strip()
+            profiler.context["query"] = query
+            view_key = chat_hash
+            if query:
+                # The index is built on the first search of a chat; each query is then a few array lookups
+                search_index = profiler.call("search_index", cache.get_or_compute, ("search_index", chat_hash), InvertedIndex, df)
+                matched = profiler.call("search", search_index.filter, df, query)
+                st.caption(f"{len(matched):,} matching messages")
+                view_key = (chat_hash, "search", query)
+                aggregates = profiler.call("aggregates.search", cache.get_or_compute, ("aggregates", view_key), ChatAggregates, matched)
+            top_counts = aggregates
+            if is_approximate(source):
+                # Top words, emojis and the word cloud read fixed-size sketches instead of per-token indexes
+                top_counts = profiler.call(
+                    "top_sketch", cache.get_or_compute, ("top_sketch", view_key), TopItemsSketch.from_frame,
+                    matched if query else df
+                )
+                st.caption(f"≈ Top words and emojis are approximate: a count may be high by up to {top_counts.error:.1%} of that user's total")
+            wordcloud_quality = st.select_slider(
+                "🖼️ Word cloud quality", options=list(WORDCLOUD_WIDTHS), value="Balanced", key="wordcloud_quality"
+            )
             if st.button("🔍 Analyze", key="analyze_button"):
                 st.session_state.analyze_clicked = True
         
@@ -147,14 +310,13 @@ if chat_data:
         if st.session_state.get("analyze_clicked", False):
             with st.container():
                 st.markdown(f"<div class='card'><h3>📬 Messages from: {selected_user}</h3>", unsafe_allow_html=True)
-                filtered_df = df if selected_user == "Overall" else df[df['user'] == selected_user]
+                num_messages, total_words, num_media_messages, num_urls = profiler.call("stats", aggregates.stats, selected_user)
                 
-                if filtered_df.empty:
+                if num_messages == 0:
                     st.error(f"⚠️ No messages found for {selected_user}. Try 'Overall' or check data.")
                 else:                    
                     # Stats
                     st.markdown("<h3>📈 Statistics</h3>", unsafe_allow_html=True)
-                    num_messages, total_words, num_media_messages, num_urls = fetch_stats(filtered_df)
                     col1, col2, col3, col4 = st.columns(4)
                     with col1:
                         st.metric("Messages", num_messages)
@@ -165,250 +327,403 @@ if chat_data:
                     with col4:
                         st.metric("URLs", num_urls)
                     
-                    # Most active users
-                    if selected_user == "Overall":
-                        st.markdown("<div class='card'><h3>👥 Top Users</h3>", unsafe_allow_html=True)
-                        top_users, user_percentage_df = fetch_most_active_users(df)
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.markdown("#### 🔢 Message Share (%)", unsafe_allow_html=True)
-                            st.dataframe(user_percentage_df, use_container_width=True)
-                        with col2:
-                            st.markdown("#### 📊 Message Count", unsafe_allow_html=True)
-                            fig = go.Figure(data=[
-                                go.Bar(
-                                    x=top_users.index, y=top_users.values, orientation='v',
-                                    marker=dict(
-                                        color=top_users.values,
-                                        colorscale='Plasma',
-                                        showscale=True,
-                                        colorbar=dict(title="Messages"),
-                                        line=dict(color='#00F4FF', width=2)
-                                    ),
-                                    hovertemplate="%{y}: %{x} messages<extra></extra>"
-                                )
-                            ])
-                            fig.update_layout(
-                                title="Top 5 Most Active Users",
-                                xaxis_title="Messages", yaxis_title="Users",
-                                template='plotly_dark', title_font=dict(size=16),
-                                margin=dict(t=60, b=40), showlegend=False
-                            )
-                            st.plotly_chart(fig, use_container_width=True, key="most_active_users_chart")
-                        st.markdown("</div>", unsafe_allow_html=True)
-                    
-                    # Wordcloud
-                    st.markdown("<div class='card'><h3>🌐 Word Cloud</h3>", unsafe_allow_html=True)
-                    wordcloud = generate_wordcloud(filtered_df)
-                    if wordcloud:
-                        st.image(wordcloud, use_container_width=True)
-                    else:
-                        st.info("No words found for word cloud.")
-                    st.markdown("</div>", unsafe_allow_html=True)
+                    # Sections only run while their expander is open. Slow ones start on the worker pool first
+                    # and are filled in last, so the cheap sections render without waiting for them.
+                    sections = {}
+                    for key, label, expanded in SECTIONS:
+                        if key == "top_users" and selected_user != "Overall" or key == "matches" and not query:
+                            continue
+                        sections[key] = st.expander(label, expanded=expanded, key=f"section_{key}", on_change="rerun")
+                    opened = {key for key, section in sections.items() if section.open}
                     
-                    # Most common words
-                    st.markdown("<div class='card'><h3>📚 Top 20 Words</h3>", unsafe_allow_html=True)
-                    word_counts = fetch_most_common_words(filtered_df).head(10)
-                    if not word_counts.empty:
-                        top_words = word_counts.head(20)
-                        fig = go.Figure(data=[
-                            go.Bar(
-                                x=top_words["count"], y=top_words["word"], orientation='h',
-                                marker=dict(
-                                    color=top_words["count"],
-                                    colorscale='Viridis',
-                                    showscale=True,
-                                    colorbar=dict(title="Frequency"),
-                                    line=dict(color='#FF00FF', width=2)
-                                ),
-                                hovertemplate="%{y}: %{x} times<extra></extra>"
-                            )
-                        ])
-                        fig.update_layout(
-                            title="Top 20 Most Frequent Words",
-                            xaxis_title="Frequency", yaxis_title="Word",
-                            template='plotly_dark', title_font=dict(size=20),
-                            margin=dict(t=60, b=40), height=600, showlegend=False
+                    jobs = {}
+                    if "wordcloud" in opened:
+                        wordcloud_width = WORDCLOUD_WIDTHS[wordcloud_quality]
+                        jobs["wordcloud"] = executor.submit(
+                            profiler.call, "wordcloud", cache.get_or_compute, (view_key, selected_user, "wordcloud", wordcloud_width),
+                            lambda: render_wordcloud(top_counts.word_frequencies(selected_user), wordcloud_width)
                         )
-                        st.plotly_chart(fig, use_container_width=True, key="common_words_chart")
-                    else:
-                        st.info("No words found to display.")
-                    st.markdown("</div>", unsafe_allow_html=True)
-                    
-                    # Emoji stats
-                    st.markdown("<div class='card'><h3>😊 Top 20 Emojis</h3>", unsafe_allow_html=True)
-                    emoji_counts = fetch_emoji_stats(filtered_df).head(10)
-                    if not emoji_counts.empty:
-                        top_emojis = emoji_counts.head(20)
-                        fig = go.Figure(data=[
-                            go.Bar(
-                                x=top_emojis["count"], y=top_emojis["emoji"], orientation='h',
-                                marker=dict(
-                                    color=top_emojis["count"],
-                                    colorscale='Hot',
-                                    showscale=True,
-                                    colorbar=dict(title="Frequency"),
-                                    line=dict(color='#00FFAA', width=2)
-                                ),
-                                hovertemplate="%{y}: %{x} times<extra></extra>"
-                            )
-                        ])
-                        fig.update_layout(
-                            title="Top 20 Most Used Emojis",
-                            xaxis_title="Frequency", yaxis_title="Emoji",
-                            template='plotly_dark', title_font=dict(size=20),
-                            margin=dict(t=60, b=40), height=600, showlegend=False
-                        )
-                        st.plotly_chart(fig, use_container_width=True, key="emoji_stats_chart")
-                    else:
-                        st.info("No emojis found in the chat data.")
-                    st.markdown("</div>", unsafe_allow_html=True)
+                    if "words" in opened:
+                        jobs["words"] = executor.submit(profiler.call, "most_common_words", top_counts.most_common_words, selected_user)
+                    if "emojis" in opened:
+                        jobs["emojis"] = executor.submit(profiler.call, "emoji_stats", top_counts.emoji_stats, selected_user)
                     
+                    # Search hits, newest first
+                    if "matches" in opened:
+                        with sections["matches"]:
+                            shown = matched if selected_user == "Overall" else matched[matched['user'] == selected_user]
+                            if start_date is not None:
+                                in_range = shown['date'].dt.normalize().between(pd.Timestamp(start_date), pd.Timestamp(end_date))
+                                shown = shown[in_range]
+                            if not shown.empty:
+                                st.caption(f"Latest {min(len(shown), MAX_MATCH_ROWS):,} of {len(shown):,}")
+                                st.dataframe(
+                                    shown[['date', 'user', 'message']].tail(MAX_MATCH_ROWS).iloc[::-1],
+                                    use_container_width=True, hide_index=True
+                                )
+                            else:
+                                st.info(f"No messages from {selected_user} match '{query}'.")
+
+                    # Most active users
+                    if "top_users" in opened:
+                        with sections["top_users"]:
+                            top_users, user_percentage_df = profiler.call("most_active_users", aggregates.most_active_users)
+                            col1, col2 = st.columns(2)
+                            with col1:
+                                st.markdown("#### 🔢 Message Share (%)", unsafe_allow_html=True)
+                                st.dataframe(user_percentage_df, use_container_width=True)
+                            with col2:
+                                st.markdown("#### 📊 Message Count", unsafe_allow_html=True)
+                                fig = go.Figure(data=[
+                                    go.Bar(
+                                        x=top_users.index, y=top_users.values, orientation='v',
+                                        marker=dict(
+                                            color=top_users.values,
+                                            colorscale='Plasma',
+                                            showscale=True,
+                                            colorbar=dict(title="Messages"),
+                                            line=dict(color='#00F4FF', width=2)
+                                        ),
+                                        hovertemplate="%{y}: %{x} messages<extra></extra>"
+                                    )
+                                ])
+                                fig.update_layout(
+                                    title="Top 5 Most Active Users",
+                                    xaxis_title="Messages", yaxis_title="Users",
+                                    template='plotly_dark', title_font=dict(size=16),
+                                    margin=dict(t=60, b=40), showlegend=False
+                                )
+                                profiler.call("render.most_active_users_chart", st.plotly_chart, fig, use_container_width=True, key="most_active_users_chart")
+
                     # Monthly timeline
-                    st.markdown("<div class='card'><h3>📅 Monthly Timeline</h3>", unsafe_allow_html=True)
-                    timeline = monthly_timeline(filtered_df)
-                    if not timeline.empty:
-                        fig = px.area(
-                            timeline, x='time', y='message',
-                            title=f"Messages per Month ({selected_user})",
-                            labels={'time': 'Month-Year', 'message': 'Message Count'},
-                            template='plotly_dark',
-                            color_discrete_sequence=['#00F4FF']
-                        )
-                        fig.update_traces(
-                            line=dict(width=3),
-                            fill='tozeroy',
-                            hovertemplate="%{x}: %{y} messages<extra></extra>"
-                        )
-                        fig.update_layout(
-                            xaxis_title="Month-Year", yaxis_title="Messages",
-                            title_font=dict(size=20), xaxis_tickangle=45, height=500,
-                            showlegend=False
-                        )
-                        st.plotly_chart(fig, use_container_width=True, key="monthly_timeline_chart")
-                    else:
-                        st.info(f"No data available for monthly timeline for {selected_user}.")
-                    st.markdown("</div>", unsafe_allow_html=True)
-                    
-                    # Daily timeline
-                    st.markdown("<div class='card'><h3>📆 Daily Timeline</h3>", unsafe_allow_html=True)
-                    daily_timeline_data = daily_timeline(filtered_df)
-                    if not daily_timeline_data.empty:
-                        fig = px.area(
-                            daily_timeline_data, x='only_date', y='message',
-                            title=f"Messages per Day ({selected_user})",
-                            labels={'only_date': 'Date', 'message': 'Message Count'},
-                            template='plotly_dark',
-                            color_discrete_sequence=['#FF00FF']
-                        )
-                        fig.update_traces(
-                            line=dict(width=3),
-                            fill='tozeroy',
-                            hovertemplate="%{x|%Y-%m-%d}: %{y} messages<extra></extra>"
-                        )
-                        fig.update_layout(
-                            xaxis_title="Date", yaxis_title="Messages",
-                            title_font=dict(size=20), xaxis_tickangle=45, height=500,
-                            showlegend=False
-                        )
-                        st.plotly_chart(fig, use_container_width=True, key="daily_timeline_chart")
-                    else:
-                        st.info(f"No data available for daily timeline for {selected_user}.")
-                    st.markdown("</div>", unsafe_allow_html=True)
-                    
-                    # Activity map
-                    st.markdown("<div class='card'><h3>📊 Activity Map</h3>", unsafe_allow_html=True)
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.markdown("#### Most Active Day", unsafe_allow_html=True)
-                        busy_day = week_activity_map(filtered_df)
-                        if busy_day.sum() > 0:
-                            fig = go.Figure(data=[
-                                go.Bar(
-                                    x=busy_day.index, y=busy_day.values,
-                                    marker=dict(
-                                        color=busy_day.values,
-                                        colorscale='Teal',
-                                        showscale=True,
-                                        colorbar=dict(title="Messages"),
-                                        line=dict(color='#00FFAA', width=2)
-                                    ),
+                    if "monthly" in opened:
+                        with sections["monthly"]:
+                            timeline = profiler.call("monthly_timeline", aggregates.monthly_timeline, selected_user, start_date, end_date)
+                            if not timeline.empty:
+                                timeline = downsample_timeline(timeline, 'time')
+                                fig = px.area(
+                                    timeline, x='time', y='message',
+                                    title=f"Messages per Month ({selected_user})",
+                                    labels={'time': 'Month-Year', 'message': 'Message Count'},
+                                    template='plotly_dark',
+                                    color_discrete_sequence=['#00F4FF']
+                                )
+                                fig.update_traces(
+                                    line=dict(width=3),
+                                    fill='tozeroy',
                                     hovertemplate="%{x}: %{y} messages<extra></extra>"
                                 )
-                            ])
-                            fig.update_layout(
-                                title="Messages by Day of Week",
-                                xaxis_title="Day", yaxis_title="Messages",
-                                template='plotly_dark', title_font=dict(size=16),
-                                xaxis_tickangle=45, showlegend=False
+                                fig.update_layout(
+                                    xaxis_title="Month-Year", yaxis_title="Messages",
+                                    title_font=dict(size=20), xaxis_tickangle=45, height=500,
+                                    showlegend=False
+                                )
+                                profiler.call("render.monthly_timeline_chart", st.plotly_chart, fig, use_container_width=True, key="monthly_timeline_chart")
+                            else:
+                                st.info(f"No data available for monthly timeline for {selected_user}.")
+
+                    # Daily timeline
+                    if "daily" in opened:
+                        with sections["daily"]:
+                            resolution = st.radio(
+                                "Resolution", ["Auto"] + list(TIMELINE_RESOLUTIONS), horizontal=True, key="daily_resolution"
                             )
-                            st.plotly_chart(fig, use_container_width=True, key="activity_day_chart")
-                        else:
-                            st.info(f"No data available for day activity for {selected_user}.")
+                            daily_timeline_data = profiler.call("daily_timeline", aggregates.daily_timeline, selected_user, start_date, end_date)
+                            if not daily_timeline_data.empty:
+                                # Long histories are binned by week/month and capped at MAX_CHART_POINTS points
+                                daily_timeline_data, resolution = profiler.call(
+                                    "bounded_timeline", bounded_timeline, daily_timeline_data, resolution
+                                )
+                                fig = px.area(
+                                    daily_timeline_data, x='only_date', y='message',
+                                    title=f"Messages per {resolution} ({selected_user})",
+                                    labels={'only_date': 'Date', 'message': 'Message Count'},
+                                    template='plotly_dark',
+                                    color_discrete_sequence=['#FF00FF']
+                                )
+                                fig.update_traces(
+                                    line=dict(width=3),
+                                    fill='tozeroy',
+                                    hovertemplate="%{x|%Y-%m-%d}: %{y} messages<extra></extra>"
+                                )
+                                fig.update_layout(
+                                    xaxis_title="Date", yaxis_title="Messages",
+                                    title_font=dict(size=20), xaxis_tickangle=45, height=500,
+                                    showlegend=False
+                                )
+                                profiler.call("render.daily_timeline_chart", st.plotly_chart, fig, use_container_width=True, key="daily_timeline_chart")
+                            else:
+                                st.info(f"No data available for daily timeline for {selected_user}.")
+
+                    # Shared links
+                    if "links" in opened:
+                        with sections["links"]:
+                            domain_counts = profiler.call("link_stats", aggregates.link_stats, selected_user)
+                            if not domain_counts.empty:
+                                fig = go.Figure(data=[
+                                    go.Bar(
+                                        x=domain_counts["count"], y=domain_counts["domain"], orientation='h',
+                                        marker=dict(
+                                            color=domain_counts["count"],
+                                            colorscale='Plasma',
+                                            showscale=True,
+                                            colorbar=dict(title="Links"),
+                                            line=dict(color='#00F4FF', width=2)
+                                        ),
+                                        hovertemplate="%{y}: %{x} links<extra></extra>"
+                                    )
+                                ])
+                                fig.update_layout(
+                                    title="Most Shared Domains",
+                                    xaxis_title="Links", yaxis_title="Domain",
+                                    template='plotly_dark', title_font=dict(size=20),
+                                    margin=dict(t=60, b=40), height=600, showlegend=False,
+                                    yaxis=dict(autorange="reversed")
+                                )
+                                profiler.call("render.link_stats_chart", st.plotly_chart, fig, use_container_width=True, key="link_stats_chart")
+                            else:
+                                st.info(f"No links shared by {selected_user}.")
+
+                    # Activity map
+                    if "activity" in opened:
+                        with sections["activity"]:
+                            col1, col2 = st.columns(2)
+                            with col1:
+                                st.markdown("#### Most Active Day", unsafe_allow_html=True)
+                                busy_day = profiler.call("week_activity_map", aggregates.week_activity_map, selected_user, start_date, end_date)
+                                if busy_day.sum() > 0:
+                                    fig = go.Figure(data=[
+                                        go.Bar(
+                                            x=busy_day.index, y=busy_day.values,
+                                            marker=dict(
+                                                color=busy_day.values,
+                                                colorscale='Teal',
+                                                showscale=True,
+                                                colorbar=dict(title="Messages"),
+                                                line=dict(color='#00FFAA', width=2)
+                                            ),
+                                            hovertemplate="%{x}: %{y} messages<extra></extra>"
+                                        )
+                                    ])
+                                    fig.update_layout(
+                                        title="Messages by Day of Week",
+                                        xaxis_title="Day", yaxis_title="Messages",
+                                        template='plotly_dark', title_font=dict(size=16),
+                                        xaxis_tickangle=45, showlegend=False
+                                    )
+                                    profiler.call("render.activity_day_chart", st.plotly_chart, fig, use_container_width=True, key="activity_day_chart")
+                                else:
+                                    st.info(f"No data available for day activity for {selected_user}.")
                     
-                    with col2:
-                        st.markdown("#### Most Active Month", unsafe_allow_html=True)
-                        busy_month = month_activity_map(filtered_df)
-                        if busy_month.sum() > 0:
-                            fig = go.Figure(data=[
-                                go.Bar(
-                                    x=busy_month.index, y=busy_month.values,
-                                    marker=dict(
-                                        color=busy_month.values,
-                                        colorscale='Portland',
-                                        showscale=True,
-                                        colorbar=dict(title="Messages"),
-                                        line=dict(color='#FF00FF', width=2)
-                                    ),
-                                    hovertemplate="%{x}: %{y} messages<extra></extra>"
+                            with col2:
+                                st.markdown("#### Most Active Month", unsafe_allow_html=True)
+                                busy_month = profiler.call("month_activity_map", aggregates.month_activity_map, selected_user, start_date, end_date)
+                                if busy_month.sum() > 0:
+                                    fig = go.Figure(data=[
+                                        go.Bar(
+                                            x=busy_month.index, y=busy_month.values,
+                                            marker=dict(
+                                                color=busy_month.values,
+                                                colorscale='Portland',
+                                                showscale=True,
+                                                colorbar=dict(title="Messages"),
+                                                line=dict(color='#FF00FF', width=2)
+                                            ),
+                                            hovertemplate="%{x}: %{y} messages<extra></extra>"
+                                        )
+                                    ])
+                                    fig.update_layout(
+                                        title="Messages by Month",
+                                        xaxis_title="Month", yaxis_title="Messages",
+                                        template='plotly_dark', title_font=dict(size=16),
+                                        xaxis_tickangle=45, showlegend=False
+                                    )
+                                    profiler.call("render.activity_month_chart", st.plotly_chart, fig, use_container_width=True, key="activity_month_chart")
+                                else:
+                                    st.info(f"No data available for month activity for {selected_user}.")
+
+                    # Activity Heatmap
+                    if "heatmap" in opened:
+                        with sections["heatmap"]:
+                            heatmap_data = profiler.call("activity_heatmap", aggregates.activity_heatmap, selected_user, start_date, end_date)
+                            if not heatmap_data.empty and heatmap_data.values.sum() > 0:
+                                fig = px.imshow(
+                                    heatmap_data,
+                                    x=list(heatmap_data.columns),
+                                    y=list(heatmap_data.index),
+                                    labels=dict(x="Hour of Day", y="Day of Week", color="Messages"),
+                                    title=f"Message Activity Heatmap ({selected_user})",
+                                    text_auto=True,  # optional: shows message counts in each cell
+                                    color_continuous_scale=[
+                                        [0, '#000000'], [0.2, '#00F4FF'], [0.5, "#86D821"], [1, "#FF0000"]
+                                    ],
+                                    template='plotly_dark'
+                                )
+                                fig.update_layout(
+                                    title=f"Message Activity Heatmap ({selected_user})",
+                                    title_font=dict(size=20),
+                                    xaxis=dict(type='category'),  # 🚨 Force x-axis to treat labels as categories
+                                    height=500
+                                )
+                                fig.update_traces(
+                                    hovertemplate="%{y}, %{x}: %{z} messages<extra></extra>",
+                                    zmin=0, zmax=heatmap_data.values.max(),
+                                    showscale=True
                                 )
-                            ])
-                            fig.update_layout(
-                                title="Messages by Month",
-                                xaxis_title="Month", yaxis_title="Messages",
-                                template='plotly_dark', title_font=dict(size=16),
-                                xaxis_tickangle=45, showlegend=False
+                                profiler.call("render.weekly_heatmap_chart", st.plotly_chart, fig, use_container_width=True, key="weekly_heatmap_chart")
+                            else:
+                                st.info(f"No data available for activity heatmap for {selected_user}.")
+
+                    # Conversation dynamics
+                    if "dynamics" in opened:
+                        with sections["dynamics"]:
+                            gap_minutes = st.select_slider(
+                                "Idle minutes that end a session", options=SESSION_GAP_OPTIONS, value=SESSION_GAP_MINUTES,
+                                key="session_gap", help="Replies only count within a session"
+                            )
+                            # Replies need every message in order, so this always covers the whole chat
+                            dynamics = profiler.call(
+                                "conversation_dynamics", cache.get_or_compute, ("dynamics", chat_hash, gap_minutes),
+                                ConversationDynamics, df, gap_minutes
                             )
-                            st.plotly_chart(fig, use_container_width=True, key="activity_month_chart")
-                        else:
-                            st.info(f"No data available for month activity for {selected_user}.")
-                    st.markdown("</div>", unsafe_allow_html=True)
+                            replies, median_reply, sessions_joined, sessions_started = dynamics.user_stats(selected_user)
+                            col1, col2, col3, col4 = st.columns(4)
+                            with col1:
+                                st.metric("Replies", replies)
+                            with col2:
+                                st.metric("Median reply", "-" if pd.isna(median_reply) else f"{median_reply:.1f} min")
+                            with col3:
+                                st.metric("Sessions", sessions_joined)
+                            with col4:
+                                st.metric("Sessions started", sessions_started)
+                            user_table = dynamics.user_table()
+                            if len(user_table) > 1:
+                                col1, col2 = st.columns(2)
+                                with col1:
+                                    st.markdown("#### ⏱️ Replies & Sessions", unsafe_allow_html=True)
+                                    st.dataframe(user_table.round(1), use_container_width=True)
+                                with col2:
+                                    starters = dynamics.starter_share()
+                                    fig = go.Figure(data=[
+                                        go.Bar(
+                                            x=starters.index, y=starters.values,
+                                            marker=dict(
+                                                color=starters.values,
+                                                colorscale='Plasma',
+                                                showscale=True,
+                                                colorbar=dict(title="%"),
+                                                line=dict(color='#00F4FF', width=2)
+                                            ),
+                                            hovertemplate="%{x}: %{y}% of sessions<extra></extra>"
+                                        )
+                                    ])
+                                    fig.update_layout(
+                                        title="Who Starts Conversations",
+                                        xaxis_title="User", yaxis_title="Sessions started (%)",
+                                        template='plotly_dark', title_font=dict(size=16),
+                                        xaxis_tickangle=45, showlegend=False
+                                    )
+                                    profiler.call("render.starters_chart", st.plotly_chart, fig, use_container_width=True, key="starters_chart")
+                                matrix = dynamics.reply_matrix.loc[user_table.index, user_table.index]
+                                fig = px.imshow(
+                                    matrix,
+                                    labels=dict(x="Replied to", y="Reply from", color="Replies"),
+                                    title="Who Replies to Whom",
+                                    text_auto=len(matrix) <= 15,
+                                    color_continuous_scale=[
+                                        [0, '#000000'], [0.2, '#00F4FF'], [0.5, "#86D821"], [1, "#FF0000"]
+                                    ],
+                                    template='plotly_dark'
+                                )
+                                fig.update_layout(title_font=dict(size=20), xaxis=dict(type='category'), yaxis=dict(type='category'), height=600)
+                                fig.update_traces(hovertemplate="%{y} → %{x}: %{z} replies<extra></extra>")
+                                profiler.call("render.reply_matrix_chart", st.plotly_chart, fig, use_container_width=True, key="reply_matrix_chart")
+                            else:
+                                st.info("Replies and conversation starters need at least two participants.")
 
-                    # Activity Heatmap
-                    st.markdown("<div class='card'><h3>🔥 Activity Heatmap</h3>", unsafe_allow_html=True)
-                    heatmap_data = activity_heatmap(filtered_df)
-                    if not heatmap_data.empty and heatmap_data.values.sum() > 0:
-                        fig = px.imshow(
-                            heatmap_data,
-                            x=list(heatmap_data.columns),
-                            y=list(heatmap_data.index),
-                            labels=dict(x="Hour of Day", y="Day of Week", color="Messages"),
-                            title=f"Message Activity Heatmap ({selected_user})",
-                            text_auto=True,  # optional: shows message counts in each cell
-                            color_continuous_scale=[
-                                [0, '#000000'], [0.2, '#00F4FF'], [0.5, "#86D821"], [1, "#FF0000"]
-                            ],
-                            template='plotly_dark'
-                        )
-                        fig.update_layout(
-                            title=f"Message Activity Heatmap ({selected_user})",
-                            title_font=dict(size=20),
-                            xaxis=dict(type='category'),  # 🚨 Force x-axis to treat labels as categories
-                            height=500
-                        )
-                        fig.update_traces(
-                            hovertemplate="%{y}, %{x}: %{z} messages<extra></extra>",
-                            zmin=0, zmax=heatmap_data.values.max(),
-                            showscale=True
-                        )
-                        st.plotly_chart(fig, use_container_width=True, key="weekly_heatmap_chart")
-                    else:
-                        st.info(f"No data available for activity heatmap for {selected_user}.")
-                    st.markdown("</div>", unsafe_allow_html=True)
+                    # Wordcloud
+                    if "wordcloud" in opened:
+                        with sections["wordcloud"]:
+                            with st.spinner("Drawing word cloud..."):
+                                wordcloud = jobs["wordcloud"].result()
+                            if wordcloud:
+                                profiler.call("render.wordcloud", st.image, wordcloud, use_container_width=True)
+                            else:
+                                st.info("No words found for word cloud.")
+
+                    # Most common words
+                    if "words" in opened:
+                        with sections["words"]:
+                            with st.spinner("Counting words..."):
+                                word_counts = jobs["words"].result().head(10)
+                            if not word_counts.empty:
+                                top_words = word_counts.head(20)
+                                fig = go.Figure(data=[
+                                    go.Bar(
+                                        x=top_words["count"], y=top_words["word"], orientation='h',
+                                        marker=dict(
+                                            color=top_words["count"],
+                                            colorscale='Viridis',
+                                            showscale=True,
+                                            colorbar=dict(title="Frequency"),
+                                            line=dict(color='#FF00FF', width=2)
+                                        ),
+                                        hovertemplate="%{y}: %{x} times<extra></extra>"
+                                    )
+                                ])
+                                fig.update_layout(
+                                    title="Top 20 Most Frequent Words",
+                                    xaxis_title="Frequency", yaxis_title="Word",
+                                    template='plotly_dark', title_font=dict(size=20),
+                                    margin=dict(t=60, b=40), height=600, showlegend=False
+                                )
+                                profiler.call("render.common_words_chart", st.plotly_chart, fig, use_container_width=True, key="common_words_chart")
+                            else:
+                                st.info("No words found to display.")
+
+                    # Emoji stats
+                    if "emojis" in opened:
+                        with sections["emojis"]:
+                            with st.spinner("Scanning emojis..."):
+                                emoji_counts = jobs["emojis"].result().head(10)
+                            if not emoji_counts.empty:
+                                top_emojis = emoji_counts.head(20)
+                                fig = go.Figure(data=[
+                                    go.Bar(
+                                        x=top_emojis["count"], y=top_emojis["emoji"], orientation='h',
+                                        marker=dict(
+                                            color=top_emojis["count"],
+                                            colorscale='Hot',
+                                            showscale=True,
+                                            colorbar=dict(title="Frequency"),
+                                            line=dict(color='#00FFAA', width=2)
+                                        ),
+                                        hovertemplate="%{y}: %{x} times<extra></extra>"
+                                    )
+                                ])
+                                fig.update_layout(
+                                    title="Top 20 Most Used Emojis",
+                                    xaxis_title="Frequency", yaxis_title="Emoji",
+                                    template='plotly_dark', title_font=dict(size=20),
+                                    margin=dict(t=60, b=40), height=600, showlegend=False
+                                )
+                                profiler.call("render.emoji_stats_chart", st.plotly_chart, fig, use_container_width=True, key="emoji_stats_chart")
+                            else:
+                                st.info("No emojis found in the chat data.")
      
 else:
     st.info("👈 Upload a chat file to analyze it.")
-    st.markdown("**Expected format**: `12/31/2024, 11:59 PM - User: Message`")
+    st.markdown("**Expected format**: `12/31/2024, 11:59 PM - User: Message` (Android, 12- or 24-hour) or `[31/12/24, 23:59:07] User: Message` (iOS)")
+
+# Diagnostics
+if diagnostics:
+    with st.sidebar:
+        st.markdown("#### 🩺 Diagnostics", unsafe_allow_html=True)
+        if profiler.records:
+            st.dataframe(profiler.frame().round(4), use_container_width=True, hide_index=True)
+        else:
+            st.caption("Nothing measured yet.")
+profiler.finish()
 
 # Footer
 st.markdown("<div style='text-align: center; color: #00FFAA; margin-top: 20px;'>Made with ❤️ by Adeel Hassan (<a href='https://github.com/adeelHassan123' style='color: #00F4FF;'>GitHub</a>)</div>", unsafe_allow_html=True)
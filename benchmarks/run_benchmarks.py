@@ -0,0 +1,173 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import preprocessor
+import utils
+from aggregates import ChatAggregates
+from sketch import TopItemsSketch
+from synthetic_chat import generate_chat
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+UTILS_STAGES = [
+    'fetch_stats', 'fetch_most_active_users', 'fetch_most_common_words', 'fetch_emoji_stats',
+    'monthly_timeline', 'daily_timeline', 'week_activity_map', 'month_activity_map', 'activity_heatmap',
+]
+
+# ---------------- STAGES ----------------
+def stages_for(text):
+    # (name, callable) pairs; each stage's inputs are prepared by the stages before it
+    state = {}
+
+    def date_split():
+        state['pairs'] = list(preprocessor.iter_messages(preprocessor.iter_lines(text)))
+        return len(state['pairs'])
+
+    def user_split():
+        users, _ = preprocessor.split_users(pd.Series([msg for _, msg in state['pairs']], dtype=str))
+        return len(users)
+
+    def datetime_conversion():
+        return len(preprocessor.parse_dates([date for date, _ in state['pairs']]))
+
+    def preprocess():
+        state['df'] = preprocessor.preprocess(text, workers=1)
+        return len(state['df'])
+
+    def compact():
+        df = preprocessor.compact_frame(state['df'])
+        state['chat'] = df[df['user'] != 'Group_Message']
+        return len(state['chat'])
+
+    def aggregates():
+        state['aggregates'] = ChatAggregates(state['chat'])
+        # Token and emoji indexes are lazy; build them here so the stage covers the full cost
+        state['aggregates'].words, state['aggregates'].emojis
+        return len(state['chat'])
+
+    def top_sketch():
+        # Bounded-memory alternative to the exact token and emoji indexes
+        state['sketch'] = TopItemsSketch.from_frame(state['chat'])
+        return len(state['chat'])
+
+    def wordcloud():
+        image = utils.render_wordcloud(state['aggregates'].word_frequencies())
+        return 0 if image is None else 1
+
+    def utils_stage(name):
+        def run():
+            getattr(utils, name)(state['chat'])
+            return len(state['chat'])
+        return run
+
+    return ([('date_split', date_split), ('user_split', user_split), ('datetime_conversion', datetime_conversion),
+             ('preprocess', preprocess), ('compact', compact)]
+            + [(name, utils_stage(name)) for name in UTILS_STAGES]
+            + [('aggregates', aggregates), ('top_sketch', top_sketch), ('wordcloud', wordcloud)])
+
+def worker_sweep(text, workers):
+    # preprocess on a process pool of each size; workers=1 is the serial parser
+    def run(count):
+        def parse():
+            return len(preprocessor.preprocess(text, workers=count))
+        return parse
+    return [(count, run(count)) for count in workers]
+
+def measure(func, track_memory):
+    gc.collect()
+    start = time.perf_counter()
+    rows = func()
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if track_memory:
+        # Second run under tracemalloc, so tracing overhead never skews the timing
+        gc.collect()
+        tracemalloc.start()
+        func()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return rows, seconds, peak_mb
+
+# ---------------- REGRESSIONS ----------------
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['size'], r['stage'], r.get('workers')): r for r in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        before = baseline.get((result['size'], result['stage'], result.get('workers')))
+        if before is None:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            old, new = before.get(metric), result.get(metric)
+            # Ignore sub-10ms timings: they are mostly noise
+            if old and new and new > old * (1 + tolerance) and (metric != 'seconds' or new > 0.01):
+                workers = '' if result.get('workers') is None else f" x{result['workers']} workers"
+                regressions.append(f"{result['stage']}{workers} @ {result['size']:,}: {metric} {old:.3f} -> {new:.3f}")
+    return regressions
+
+# ---------------- ENTRY POINT ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile each analysis stage on synthetic chats.")
+    parser.add_argument('--sizes', type=lambda s: [int(x) for x in s.split(',')], default=DEFAULT_SIZES,
+                        help="comma-separated message counts (default: 1k to 10M)")
+    parser.add_argument('--stages', type=lambda s: s.split(','), help="only run these stages (prerequisites still run)")
+    parser.add_argument('--workers', type=lambda s: [int(x) for x in s.split(',')],
+                        help="also time preprocess with each of these worker counts, e.g. 1,2,4,8")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass")
+    parser.add_argument('--output', help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--baseline', help="earlier results file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown/growth vs baseline (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    # Compile the emoji matchers up front so the first size does not pay for them
+    utils.emoji_pattern()
+    utils.emoji_run_pattern()
+
+    results = []
+    for size in args.sizes:
+        text = generate_chat(size)
+        for stage, func in stages_for(text):
+            selected = args.stages is None or stage in args.stages
+            rows, seconds, peak_mb = measure(func, track_memory=selected and not args.no_memory)
+            if not selected:
+                continue
+            results.append({'size': size, 'stage': stage, 'rows': rows, 'seconds': seconds, 'peak_mb': peak_mb})
+            memory = '' if peak_mb is None else f"  {peak_mb:9.1f} MB"
+            print(f"{size:>11,}  {stage:<24} {seconds:9.3f} s{memory}", flush=True)
+        # Wall time only: tracemalloc cannot see the worker processes
+        for workers, func in worker_sweep(text, args.workers or []):
+            rows, seconds, _ = measure(func, track_memory=False)
+            results.append({'size': size, 'stage': 'preprocess', 'workers': workers, 'rows': rows, 'seconds': seconds, 'peak_mb': None})
+            print(f"{size:>11,}  {f'preprocess x{workers}':<24} {seconds:9.3f} s", flush=True)
+
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    output = args.output or os.path.join(RESULTS_DIR, f"{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    meta = {
+        'timestamp': stamp, 'python': platform.python_version(), 'pandas': pd.__version__,
+        'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
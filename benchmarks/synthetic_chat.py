@@ -0,0 +1,91 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+
+# Export layouts the parser reads:
+#   android12  'DD/MM/YYYY, H:MM<sep>am - User: message'
+#   android24  'DD/MM/YY, HH:MM - User: message'
+#   ios        '[DD/MM/YY, HH:MM:SS] User: message'
+NARROW_NBSP = '\u202f'
+LAYOUTS = ['android12', 'android24', 'ios']
+
+WORDS = (
+    "hello hi ok okay yes no haha lol thanks please sure today tomorrow tonight meeting call "
+    "send file photo done nice good great where when what why how coming going home office "
+    "class exam project deadline lunch dinner party weekend plan movie match game price").split()
+EMOJIS = ['😂', '❤️', '👍', '👍🏽', '🙏', '🔥', '😍', '😭', '🎉', '🇵🇰', '👨‍👩‍👧', '1️⃣', '🤣', '😊']
+DOMAINS = ['youtube.com', 'instagram.com', 'github.com', 'docs.google.com', 'example.org', 'twitter.com']
+SYSTEM_EVENTS = ['{a} added {b}', '{a} left', '{a} changed the group description', '{a} joined using this group\'s invite link']
+
+# ---------------- GENERATOR ----------------
+def generate_lines(n_messages, n_users=10, emoji_rate=0.15, media_rate=0.06, url_rate=0.04,
+                   multiline_rate=0.03, deleted_rate=0.01, system_rate=0.01, nbsp_rate=1.0,
+                   layout='android12', start=datetime(2020, 1, 1), seed=0):
+    # Yields export lines one at a time, so multi-million message chats never sit in memory
+    rng = random.Random(seed)
+    users = [f"User {i}" for i in range(n_users)]
+    # A few realistic unsaved-contact names
+    users[::4] = [f"+92 3{rng.randint(10, 49)} {rng.randint(1000000, 9999999)}" for _ in users[::4]]
+    weights = [1 / (i + 1) for i in range(n_users)]
+    when = start
+
+    yield "Messages and calls are end-to-end encrypted. No one outside of this chat can read them.\n"
+    for _ in range(n_messages):
+        when += timedelta(seconds=rng.expovariate(1 / 900))
+        # Drawn for every layout so the same seed gives the same messages in each
+        sep = NARROW_NBSP if rng.random() < nbsp_rate else ' '
+        if layout == 'ios':
+            prefix = f"[{when:%d/%m/%y, %H:%M:%S}] "
+        elif layout == 'android24':
+            prefix = f"{when:%d/%m/%y, %H:%M} - "
+        else:
+            hour = when.hour % 12 or 12
+            prefix = f"{when.day:02d}/{when.month:02d}/{when.year}, {hour}:{when.minute:02d}{sep}{'am' if when.hour < 12 else 'pm'} - "
+        user = rng.choices(users, weights)[0]
+
+        roll = rng.random()
+        if roll < system_rate:
+            yield prefix + rng.choice(SYSTEM_EVENTS).format(a=user, b=rng.choice(users)) + "\n"
+            continue
+        roll -= system_rate
+        if roll < media_rate:
+            body = "<Media omitted>"
+        elif roll < media_rate + deleted_rate:
+            body = "This message was deleted"
+        else:
+            body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 14)))
+            if rng.random() < url_rate:
+                body += f" https://{rng.choice(DOMAINS)}/{rng.randint(1, 10 ** 6)}"
+            if rng.random() < emoji_rate:
+                body += " " + "".join(rng.choice(EMOJIS) for _ in range(rng.randint(1, 4)))
+            if rng.random() < multiline_rate:
+                body += "\n" + "\n".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8)))
+                                         for _ in range(rng.randint(1, 3)))
+        yield f"{prefix}{user}: {body}\n"
+
+def generate_chat(n_messages, **options):
+    return "".join(generate_lines(n_messages, **options))
+
+def write_chat(path, n_messages, **options):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(generate_lines(n_messages, **options))
+
+# ---------------- ENTRY POINT ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic WhatsApp chat export.")
+    parser.add_argument('path')
+    parser.add_argument('-n', '--messages', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--emoji-rate', type=float, default=0.15)
+    parser.add_argument('--media-rate', type=float, default=0.06)
+    parser.add_argument('--url-rate', type=float, default=0.04)
+    parser.add_argument('--multiline-rate', type=float, default=0.03)
+    parser.add_argument('--nbsp-rate', type=float, default=1.0, help="share of am/pm prefixed by U+202F instead of a space")
+    parser.add_argument('--layout', choices=LAYOUTS, default='android12', help="timestamp layout (default: android12)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    write_chat(args.path, args.messages, n_users=args.users, emoji_rate=args.emoji_rate, media_rate=args.media_rate,
+               url_rate=args.url_rate, multiline_rate=args.multiline_rate, nbsp_rate=args.nbsp_rate, layout=args.layout, seed=args.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+
+# Total memory budget for cached parses and analytics, shared by all sessions
+CACHE_BUDGET_MB = int(os.environ.get("CHAT_CACHE_MB", "512"))
+
+# On-disk store of parsed chats, kept across restarts
+CACHE_DIR = os.environ.get("CHAT_CACHE_DIR", ".chat_cache")
+DISK_CACHE_MB = int(os.environ.get("CHAT_DISK_CACHE_MB", "2048"))
+
+# Leading bytes used to recognise a re-export of a chat already in the store
+HEAD_BYTES = 4096
+
+logger = logging.getLogger(__name__)
+
+# ---------------- KEYS & SIZES ----------------
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def estimate_size(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if hasattr(value, "getbands"):
+        # PIL image: pixel buffer size
+        return value.width * value.height * len(value.getbands())
+    if hasattr(value, "__dict__"):
+        # Plain objects such as ChatAggregates: size of their attributes
+        return sys.getsizeof(value) + estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+# ---------------- LRU CACHE ----------------
+class LRUCache:
+    def __init__(self, max_bytes=CACHE_BUDGET_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, size), oldest first
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                # Larger than the whole budget: hand it back uncached
+                return value
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+        return value
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, func(*args, **kwargs))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+# ---------------- PARQUET STORE ----------------
+class ParquetStore:
+    # One Parquet file per content hash; file mtime doubles as last-used time for eviction.
+    # Files written under another version are never loaded and age out through eviction.
+    def __init__(self, directory=CACHE_DIR, max_bytes=DISK_CACHE_MB * 1024 * 1024, version=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        suffix = "" if self.version is None else f".v{self.version}"
+        return os.path.join(self.directory, f"{key}{suffix}.parquet")
+
+    def load(self, key):
+        path = self.path(key)
+        start = time.perf_counter()
+        try:
+            df = pd.read_parquet(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logger.info("Loaded %s from disk cache in %.3fs", key, time.perf_counter() - start)
+        return df
+
+    def save(self, key, df):
+        path = self.path(key)
+        # Write under a temporary name so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.warning("Could not write %s to disk cache", key, exc_info=True)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    # ---------------- RE-EXPORTS ----------------
+    # A re-exported chat starts with the bytes of the earlier export, so the hash of its first
+    # HEAD_BYTES points at the longest stored export with that head.
+    def _head_path(self, head):
+        return os.path.join(self.directory, f"{content_hash(head[:HEAD_BYTES])}.head")
+
+    def remember(self, head, length, key, day_first=None):
+        # day_first: the date order the stored frame was parsed with, so appended text is read the same way
+        path = self._head_path(head)
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"hash": key, "length": length, "day_first": day_first}, f)
+        except OSError:
+            logger.warning("Could not record head of %s", key, exc_info=True)
+
+    def find_base(self, head, length, prefix_hash):
+        # (key, length, day_first) of a stored export that a new export of `length` bytes extends, or None.
+        # day_first is None for entries written before it was recorded.
+        # prefix_hash(n) hashes the new export's first n bytes; it only runs when the head matches.
+        try:
+            with open(self._head_path(head), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        key, base_length = entry.get("hash"), entry.get("length", 0)
+        if not key or base_length >= length or not os.path.exists(self.path(key)):
+            return None
+        if prefix_hash(base_length) != key:
+            return None
+        return key, base_length, entry.get("day_first")
+
+    def evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".parquet"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,139 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from aggregates import OVERALL, ChatAggregates
+from dynamics import ConversationDynamics
+from ingest import ChatSource, parse_source
+from sketch import APPROX_ERROR, TopItemsSketch
+
+logger = logging.getLogger(__name__)
+
+# ---------------- REPORT ----------------
+def _per_user(aggregates, method):
+    # One table with a 'user' column: every user plus the Overall sum
+    frames = []
+    for user in [OVERALL] + aggregates.users:
+        table = getattr(aggregates, method)(user)
+        if isinstance(table, pd.Series):
+            table = table.reset_index()
+        if not table.empty:
+            frames.append(table.assign(user=user))
+    if not frames:
+        return pd.DataFrame(columns=['user'])
+    report = pd.concat(frames, ignore_index=True)
+    return report[['user'] + [col for col in report.columns if col != 'user']]
+
+def chat_report(df, top_items=None):
+    # top_items: a TopItemsSketch filled while parsing, used for words and emojis instead of exact counts
+    df = df[df['user'] != 'Group_Message']
+    aggregates = ChatAggregates(df)
+    top_counts = top_items if top_items is not None else aggregates
+    dynamics = ConversationDynamics(df)
+    replies = dynamics.reply_matrix.stack().rename('replies').reset_index()
+    stats = pd.DataFrame(
+        [(user,) + aggregates.stats(user) for user in [OVERALL] + aggregates.users],
+        columns=['user', 'messages', 'words', 'media', 'urls'],
+    )
+    return {
+        'stats': stats,
+        'top_words': _per_user(top_counts, 'most_common_words'),
+        'emojis': _per_user(top_counts, 'emoji_stats'),
+        'domains': _per_user(aggregates, 'link_stats'),
+        'monthly_timeline': _per_user(aggregates, 'monthly_timeline'),
+        'daily_timeline': _per_user(aggregates, 'daily_timeline'),
+        'dynamics': dynamics.summary.reset_index(),
+        'reply_matrix': replies[replies['replies'] > 0],
+    }
+
+# ---------------- OUTPUT ----------------
+def write_json(report, path, meta):
+    payload = dict(meta)
+    for name, table in report.items():
+        payload[name] = json.loads(table.to_json(orient='records', date_format='iso', force_ascii=False))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+def write_parquet(report, directory, meta):
+    os.makedirs(directory, exist_ok=True)
+    for name, table in report.items():
+        table.to_parquet(os.path.join(directory, f"{name}.parquet"), index=False)
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+def analyze_file(path, output_dir, fmt, approx_error=None, name=None, parse_workers=1):
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        # .txt or .zip export, streamed into the parser; exports above PARALLEL_THRESHOLD are parsed
+        # on parse_workers processes (the CPUs left over by the per-file pool)
+        source = ChatSource(f, path)
+        sketch = TopItemsSketch(approx_error) if approx_error else None
+        df = parse_source(source, workers=parse_workers, compact=True,
+                          on_batch=sketch.update if sketch is not None else None)
+        chat_hash = source.hash()
+    report = chat_report(df, sketch)
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    meta = {'chat': name, 'source': os.path.abspath(path), 'sha256': chat_hash, 'messages': len(df),
+            'media_files': source.media_files, 'approximate_error': approx_error}
+    if fmt == 'json':
+        out_path = os.path.join(output_dir, f"{name}.json")
+        write_json(report, out_path, meta)
+    else:
+        out_path = os.path.join(output_dir, name)
+        write_parquet(report, out_path, meta)
+    return path, out_path, time.perf_counter() - start
+
+# ---------------- ENTRY POINT ----------------
+def find_exports(input_dir):
+    return sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith(('.txt', '.zip')) and os.path.isfile(os.path.join(input_dir, name))
+    )
+
+def report_names(exports):
+    # Report name per export: the file stem, plus the extension when a .txt and a .zip share it
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in exports]
+    taken = [stem.lower() for stem in stems]
+    return {
+        path: stem if taken.count(stem.lower()) == 1 else os.path.basename(path)
+        for path, stem in zip(exports, stems)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory of WhatsApp chat exports without the web app.")
+    parser.add_argument('input_dir', help="directory containing exported .txt or .zip chats")
+    parser.add_argument('-o', '--output-dir', default='reports', help="where reports are written (default: reports)")
+    parser.add_argument('-f', '--format', choices=['json', 'parquet'], default='json', help="report format (default: json)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help="chats analyzed in parallel (default: CPU count)")
+    parser.add_argument('--approximate', nargs='?', type=float, const=APPROX_ERROR, metavar='ERROR',
+                        help=f"bounded-memory top words/emojis; counts may be high by ERROR x the user's total (default: {APPROX_ERROR})")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+
+    exports = find_exports(args.input_dir)
+    if not exports:
+        logger.error("No .txt or .zip exports found in %s", args.input_dir)
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    names = report_names(exports)
+    pool_size = max(1, args.workers)
+    parse_workers = max(1, (os.cpu_count() or 1) // min(pool_size, len(exports)))
+    failed = 0
+    with ProcessPoolExecutor(max_workers=pool_size) as pool:
+        futures = {pool.submit(analyze_file, path, args.output_dir, args.format, args.approximate, names[path], parse_workers): path for path in exports}
+        for future, path in futures.items():
+            try:
+                _, out_path, elapsed = future.result()
+                logger.info("%s -> %s (%.2fs)", path, out_path, elapsed)
+            except Exception:
+                failed += 1
+                logger.exception("Failed to analyze %s", path)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
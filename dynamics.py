@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+OVERALL = "Overall"
+
+# Silence longer than this ends a conversation session
+SESSION_GAP_MINUTES = 60
+SESSION_GAP_OPTIONS = [15, 30, 60, 120, 240, 480]
+
+NS_PER_MINUTE = 60 * 10 ** 9
+
+def _median_by(values, groups, n_groups):
+    # Median of values per integer group; NaN for groups without values
+    medians = pd.Series(values).groupby(groups).median()
+    return medians.reindex(range(n_groups)).to_numpy()
+
+# ---------------- CONVERSATION DYNAMICS ----------------
+class ConversationDynamics:
+    # Replies and sessions from the time-ordered (date, user) columns, with array shifts only.
+    # A session ends after gap_minutes of silence; a reply is the first message after someone
+    # else's message in the same session, and its latency is the time since that message.
+    def __init__(self, df, gap_minutes=SESSION_GAP_MINUTES):
+        self.gap_minutes = gap_minutes
+        messages = df[df['date'].notna()]
+        if 'is_system' in messages:
+            messages = messages[~messages['is_system'].to_numpy(dtype=bool)]
+        codes, users = pd.factorize(messages['user'], sort=True)
+        self.users = [str(user) for user in users]
+        dates = messages['date'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        if len(dates) and (np.diff(dates) < 0).any():
+            order = np.argsort(dates, kind='stable')
+            dates, codes = dates[order], codes[order]
+        self._build(dates, codes.astype(np.int64))
+
+    def _build(self, dates, codes):
+        n_users, n = len(self.users), len(dates)
+        new_session = np.ones(n, dtype=bool)
+        new_session[1:] = np.diff(dates) > self.gap_minutes * NS_PER_MINUTE
+        # Replies: the sender changes inside a session
+        reply = np.zeros(n, dtype=bool)
+        reply[1:] = (codes[1:] != codes[:-1]) & ~new_session[1:]
+        replies = np.flatnonzero(reply)
+        replier, replied_to = codes[replies], codes[replies - 1]
+        latency = (dates[replies] - dates[replies - 1]) / NS_PER_MINUTE
+        pairs = np.bincount(replier * n_users + replied_to, minlength=n_users * n_users)
+        # Rows reply to columns
+        self.reply_matrix = pd.DataFrame(
+            pairs.reshape(n_users, n_users), index=pd.Index(self.users, name='user'),
+            columns=pd.Index(self.users, name='replied_to')
+        )
+
+        starts = np.flatnonzero(new_session)
+        # Each session runs to the message before the next one starts (no sessions without messages)
+        ends = np.append(starts[1:], n) - 1 if n else starts
+        session_ids = np.cumsum(new_session) - 1
+        duration = (dates[ends] - dates[starts]) / NS_PER_MINUTE
+        self.sessions = pd.DataFrame({
+            'start': pd.to_datetime(dates[starts]),
+            'end': pd.to_datetime(dates[ends]),
+            'messages': ends - starts + 1,
+            'minutes': duration,
+            'starter': pd.Categorical.from_codes(codes[starts], categories=self.users),
+        })
+        # Each user once per session they wrote in
+        joined = pd.unique(session_ids * n_users + codes)
+        joined_session, joined_user = joined // n_users, joined % n_users
+
+        per_user = pd.DataFrame({
+            'messages': np.bincount(codes, minlength=n_users),
+            'replies': np.bincount(replier, minlength=n_users),
+            'median_reply_minutes': _median_by(latency, replier, n_users),
+            'sessions': np.bincount(joined_user, minlength=n_users),
+            'sessions_started': np.bincount(codes[starts], minlength=n_users),
+            'median_session_minutes': _median_by(duration[joined_session], joined_user, n_users),
+        }, index=pd.Index(self.users, name='user'))
+        overall = pd.DataFrame({
+            'messages': [n],
+            'replies': [len(replies)],
+            'median_reply_minutes': [np.median(latency) if len(latency) else np.nan],
+            'sessions': [len(starts)],
+            'sessions_started': [len(starts)],
+            'median_session_minutes': [np.median(duration) if len(duration) else np.nan],
+        }, index=pd.Index([OVERALL], name='user'))
+        self.summary = pd.concat([per_user, overall])
+
+    # ---------------- LOOKUP ----------------
+    def user_stats(self, user=OVERALL):
+        # (replies, median reply minutes, sessions, sessions started); zeros for unknown users
+        if user not in self.summary.index:
+            return 0, np.nan, 0, 0
+        row = self.summary.loc[user]
+        return int(row['replies']), row['median_reply_minutes'], int(row['sessions']), int(row['sessions_started'])
+
+    def user_table(self):
+        # Per-user summary, most replies first
+        table = self.summary.drop(index=OVERALL)
+        return table[table['messages'] > 0].sort_values('replies', ascending=False, kind='stable')
+
+    def starter_share(self):
+        # Percentage of sessions each user opened
+        started = self.summary['sessions_started'].drop(index=OVERALL)
+        total = started.sum()
+        return (started / total * 100).round(2).sort_values(ascending=False, kind='stable') if total else started
@@ -0,0 +1,172 @@
+import hashlib
+import io
+import os
+import re
+import zipfile
+from preprocessor import (DATE_TIME_PATTERN, PARALLEL_THRESHOLD, SAMPLE_WINDOW_SIZE, SAMPLE_WINDOWS,
+                          parse_shards, preprocess, sample_day_first)
+
+# Bytes pulled from the upload per read while hashing or parsing
+CHUNK_SIZE = 1024 * 1024
+
+# Android names the text "WhatsApp Chat with <name>.txt", iOS "_chat.txt"
+CHAT_ENTRY_PATTERN = re.compile(r'(?:^|/)(?:_chat|WhatsApp Chat[^/]*)\.txt$', re.IGNORECASE)
+# Finder metadata added when an archive is re-zipped on a Mac
+IGNORED_ENTRY_PATTERN = re.compile(r'(?:^|/)(?:__MACOSX/|\.DS_Store$)')
+
+# ---------------- STREAM ----------------
+class _CountingReader(io.RawIOBase):
+    # Pass-through reader that reports progress as a fraction of the expected size.
+    # Closing it leaves the wrapped stream open unless it owns it (zip members do, uploads do not).
+    def __init__(self, stream, size, progress=None, owns=False):
+        self.stream = stream
+        self.size = size
+        self.progress = progress
+        self.owns = owns
+        self.position = 0
+        self._reported = -1
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.stream.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # Zip members emulate seeking by decompressing up to the offset
+        self.position = self.stream.seek(offset, whence)
+        return self.position
+
+    def readinto(self, buffer):
+        count = self.stream.readinto(buffer)
+        self.position += count
+        if self.progress is not None and self.size:
+            # At most one callback per percent, so UI updates stay cheap
+            percent = min(100, self.position * 100 // self.size)
+            if percent > self._reported:
+                self._reported = percent
+                self.progress(percent / 100)
+        return count
+
+    def close(self):
+        if self.owns and not self.closed:
+            self.stream.close()
+        super().close()
+
+# ---------------- CHAT SOURCE ----------------
+class ChatSource:
+    # The chat text of an upload, re-readable as a stream: the file itself for a .txt export,
+    # or the chat entry of a .zip export, decompressed on the fly and never extracted whole.
+    def __init__(self, file, name=""):
+        self.file = file
+        self.name = name
+        self.archive = None
+        self.entry = None
+        self.media_files = 0
+        file.seek(0)
+        if zipfile.is_zipfile(file):
+            self.archive = zipfile.ZipFile(file)
+            entries = [
+                info for info in self.archive.infolist()
+                if not info.is_dir() and not IGNORED_ENTRY_PATTERN.search(info.filename)
+            ]
+            self.entry = _chat_entry(entries)
+            # Photos, voice notes, stickers and documents ride along next to the chat text
+            self.media_files = sum(info is not self.entry for info in entries)
+            self.size = self.entry.file_size
+        else:
+            self.size = file.seek(0, io.SEEK_END)
+
+    def open(self, start=0, progress=None):
+        # Binary stream of the chat text from byte `start`
+        if self.archive is not None:
+            raw = _CountingReader(self.archive.open(self.entry), self.size, progress, owns=True)
+        else:
+            self.file.seek(0)
+            raw = _CountingReader(self.file, self.size, progress)
+        stream = io.BufferedReader(raw, CHUNK_SIZE)
+        if start:
+            stream.seek(start)
+        return stream
+
+    def read(self, start=0, size=-1):
+        with self.open(start) as stream:
+            return stream.read(size)
+
+    def lines(self, start=0, progress=None):
+        # Decoded lines, one buffer at a time; same splitting as io.StringIO over the decoded text
+        with self.open(start, progress) as stream:
+            yield from io.TextIOWrapper(stream, encoding="utf-8", newline="\n")
+
+    def day_first(self):
+        # DD/MM vs MM/DD from evenly spaced windows, as preprocessor.sample_day_first reads a whole string.
+        # One forward pass over the stream; windows after the first are cut to whole lines.
+        step = max(self.size // SAMPLE_WINDOWS, SAMPLE_WINDOW_SIZE)
+        windows = []
+        with self.open() as stream:
+            for start in range(0, self.size, step):
+                stream.seek(start)
+                text = stream.read(SAMPLE_WINDOW_SIZE).decode("utf-8", errors="ignore")
+                windows.append(text if start == 0 else text[text.find("\n") + 1:] if "\n" in text else "")
+        return sample_day_first("\n".join(windows))
+
+    def shard_bounds(self, count):
+        # Byte offsets cutting the chat text into at most `count` ranges, each after the first starting at a
+        # dated line (as preprocessor.shard_boundaries does for a str). One forward pass, no backward seeks,
+        # so zip members are decompressed once. A newline byte never sits inside a UTF-8 character.
+        bounds = [0]
+        with self.open() as stream:
+            position = 0
+            for i in range(1, count):
+                cut = self.size * i // count
+                if cut > position:
+                    # Skip the rest of the line holding byte cut - 1, so a line starting at `cut` is kept
+                    stream.seek(cut - 1)
+                    position = cut - 1 + len(stream.readline())
+                while position < self.size:
+                    line = stream.readline()
+                    start, position = position, position + len(line)
+                    if start > bounds[-1] and DATE_TIME_PATTERN.match(line[:64].decode("utf-8", errors="ignore")):
+                        bounds.append(start)
+                        break
+        bounds.append(self.size)
+        return bounds
+
+    def shards(self, count, progress=None):
+        # Raw bytes of each range from shard_bounds, read in one pass; workers decode their own range
+        bounds = self.shard_bounds(count)
+        with self.open(progress=progress) as stream:
+            for start, end in zip(bounds, bounds[1:]):
+                yield stream.read(end - start)
+
+    def hash(self, limit=None):
+        # sha256 of the chat text (or its first `limit` bytes); equals cache.content_hash of the bytes
+        digest = hashlib.sha256()
+        remaining = self.size if limit is None else limit
+        with self.open() as stream:
+            while remaining > 0:
+                chunk = stream.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+        return digest.hexdigest()
+
+# ---------------- PARSE ----------------
+def parse_source(source, day_first=None, workers=None, progress=None, compact=False, on_batch=None):
+    # Chats below PARALLEL_THRESHOLD bytes stream through the serial parser line by line. Larger ones are cut
+    # into byte ranges at dated lines and parsed on `workers` processes (default: CPU count); the raw bytes
+    # are held once, but the text is never decoded whole in this process.
+    day_first = source.day_first() if day_first is None else day_first
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and source.size >= PARALLEL_THRESHOLD:
+        return parse_shards(source.shards(workers, progress), day_first, on_batch, compact)
+    return preprocess(source.lines(progress=progress), compact=compact, workers=1, day_first=day_first, on_batch=on_batch)
+
+def _chat_entry(entries):
+    # The exported chat text: a WhatsApp-named .txt if present, otherwise the largest .txt
+    texts = [info for info in entries if info.filename.lower().endswith(".txt")]
+    if not texts:
+        raise ValueError("No chat .txt file found in the archive")
+    named = [info for info in texts if CHAT_ENTRY_PATTERN.search(info.filename)]
+    return max(named or texts, key=lambda info: info.file_size)
@@ -0,0 +1,74 @@
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+# Structured stage records; attach a handler to ship them elsewhere.
+# Each record carries the raw fields as record.metrics next to the JSON message.
+logger = logging.getLogger("chat_analyzer.metrics")
+
+# ---------------- PROFILER ----------------
+class Profiler:
+    # Records wall time, row count and (optionally) peak traced memory per named stage.
+    # tracemalloc keeps one process-wide peak, so memory is only measured for stages on the thread
+    # that created the profiler (the script run); stages on pool threads get peak_mb None, and their
+    # allocations still count towards whatever main-thread stage is open. Nested stages reset the peak
+    # for themselves and fold it back into their parents, so a parent's peak covers its children.
+    def __init__(self, track_memory=False, context=None):
+        self.track_memory = track_memory
+        self.context = dict(context or {})
+        self.records = []
+        self._started_tracing = False
+        self._owner = threading.get_ident()
+        # (start bytes, highest peak seen so far) of each open memory-tracked stage, innermost last
+        self._open = []
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = {'stage': name, 'rows': rows}
+        measure = self.track_memory and threading.get_ident() == self._owner
+        if measure:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self._open:
+                # Keep the parent's peak so far before this stage resets it
+                self._open[-1][1] = max(self._open[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._open.append([current, current])
+        elif self.track_memory:
+            record['peak_mb'] = None
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if measure:
+                start_bytes, peak = self._open.pop()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if self._open:
+                    self._open[-1][1] = max(self._open[-1][1], peak)
+                record['peak_mb'] = max(0, peak - start_bytes) / 2 ** 20
+            self.records.append(record)
+            fields = {**self.context, **record}
+            logger.info(json.dumps(fields, default=str), extra={'metrics': fields})
+
+    def call(self, name, func, *args, **kwargs):
+        with self.stage(name) as record:
+            result = func(*args, **kwargs)
+            if record['rows'] is None and isinstance(result, (pd.DataFrame, pd.Series)):
+                record['rows'] = len(result)
+        return result
+
+    def frame(self):
+        columns = ['stage', 'seconds', 'peak_mb', 'rows'] if self.track_memory else ['stage', 'seconds', 'rows']
+        return pd.DataFrame(self.records, columns=columns)
+
+    def finish(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
@@ -1,40 +1,174 @@
+import itertools
+import os
+import numpy as np
 import pandas as pd
+import pyarrow as pa # type: ignore
+import pyarrow.compute as pc # type: ignore
 import re
-import streamlit as st # type: ignore
+from concurrent.futures import ProcessPoolExecutor
 
-# ---------------- PREPROCESS FUNCTION ----------------
-# ---------------- PREPROCESS FUNCTION ----------------
-def preprocess(chat_data):
-    # Corrected pattern with narrow non-breaking space (u202f) before am/pm
-    date_time_pattern = r'\d{1,2}/\d{1,2}/\d{2,4},\s*\d{1,2}:\d{2}[\u202f ]?(?i:am|pm)\s*-\s*'
-    msg_list = re.split(date_time_pattern, chat_data)[1:]
-    date_list = re.findall(date_time_pattern, chat_data)
-    
-    # Clean the date strings
-    cleaned_dates = [d.replace('\u202f', '').replace('am', 'AM').replace('pm', 'PM') for d in date_list]
-    
-    df = pd.DataFrame({'msg_raw': msg_list, 'dt_raw': cleaned_dates})
-    
-    # Convert to datetime with 12-hour format
-    df['dt_raw'] = pd.to_datetime(df['dt_raw'], format='%d/%m/%Y, %I:%M%p - ', errors='coerce')
-    df.rename(columns={'dt_raw': 'date'}, inplace=True)
-    
+# Message header of every export layout we read:
+#   Android 12h  '12/05/2020, 9:15\u202fpm - '  (also ' PM', 'p. m.')
+#   Android 24h  '12/05/20, 21:15 - '            (two- or four-digit years, DD/MM or MM/DD)
+#   iOS          '[12/05/20, 21:15:07] '         (optionally after U+200E, or with AM/PM)
+DATE_TIME_PATTERN = re.compile(
+    r'\u200e?\[?\d{1,2}/\d{1,2}/\d{2,4},\s*\d{1,2}:\d{2}(?::\d{2})?[\u202f\u00a0 ]?'
+    r'(?:(?i:[ap])\.?\s?(?i:m)\.?)?(?:\]\s*|\s*-\s*)'
+)
+
+# Numeric fields of a header, captured in bulk by Arrow (RE2 syntax); missing groups come back as ''
+DATE_FIELDS_PATTERN = (r'(?P<first>\d{1,2})/(?P<second>\d{1,2})/(?P<year>\d{2,4}),\s*(?P<hour>\d{1,2}):'
+                       r'(?P<minute>\d{2})(?::(?P<sec>\d{2}))?\W*(?P<ampm>[AaPp]?)')
+
+# Day/month order is detected once per export from headers spread across the file
+DATE_ORDER_SAMPLE_PATTERN = re.compile(r'^\u200e?\[?(\d{1,2})/(\d{1,2})/\d{2,4},', re.MULTILINE)
+SAMPLE_WINDOWS = 16
+SAMPLE_WINDOW_SIZE = 64 * 1024
+
+# Message classes, matched in bulk by Arrow (RE2 syntax) over the whole message column
+URL_PATTERN = r'(?i)(?:https?://|www\.)\S+'
+URL_DOMAIN_PATTERN = r'(?i)(?:https?://|www\.)(?:www\.)?(?P<domain>[^/\s:?#]+)'
+# iOS prefixes media placeholders with an invisible left-to-right mark. With-media exports name the file:
+#   Android  'IMG-20200512-WA0001.jpg (file attached)'  (a caption follows on the next lines)
+#   iOS      '<attached: 00000005-PHOTO-2020-05-12-21-15-07.jpg>'
+LRM = '\u200e'
+MEDIA_PATTERN = (rf'{LRM}?(?:<Media omitted>|<attached: [^>\n]*>|(?:image|video|audio|sticker|GIF|document) omitted'
+                 rf'|[^\n]+ \(file attached\)(?:\n[\w\W]*)?)\s*')
+DELETED_PATTERN = rf'{LRM}?(?:This message was deleted|You deleted this message)\.?\s*'
+
+# Bump when build_frame's columns or flags change, so frames stored by older versions are not reused
+FRAME_VERSION = 3
+
+# Newline that begins a new message: a safe place to cut the export into shards
+MESSAGE_START_PATTERN = re.compile(r'\n(?=' + DATE_TIME_PATTERN.pattern + ')')
+
+USER_SPLIT_PATTERN = re.compile(r'([\w\W]+?): ')
+USER_MSG_PATTERN = re.compile(r'^(?P<user>[\w\W]+?): (?P<rest>[\w\W]*)')
+
+# Heatmap hour buckets: '00-01', '01-02', ..., '23-00'
+PERIOD_LOOKUP = {hour: f"{hour:02d}-{(hour + 1) % 24:02d}" for hour in range(24)}
+
+MONTH_ORDER = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Max number of messages held in one parsed DataFrame batch
+BATCH_SIZE = 50_000
+
+# Exports at least this many characters (bytes, for uploads) parse on a process pool by default
+PARALLEL_THRESHOLD = 20_000_000
+
+# ---------------- STREAMING PARSER ----------------
+def iter_messages(lines):
+    # Yields (date_str, raw_msg) pairs; a message runs until the next line that starts with a date
+    date_str = None
+    msg_parts = []
+    for line in lines:
+        match = DATE_TIME_PATTERN.match(line)
+        if match:
+            if date_str is not None:
+                yield date_str, ''.join(msg_parts)
+            date_str = match.group(0)
+            msg_parts = [line[match.end():]]
+        elif date_str is not None:
+            # Continuation line of a multi-line message
+            msg_parts.append(line)
+    if date_str is not None:
+        yield date_str, ''.join(msg_parts)
+
+def iter_lines(text):
+    # Lines of a string as slices, split like io.StringIO(text) but without its 4-byte-per-character copy
+    pos = 0
+    while pos < len(text):
+        end = text.find('\n', pos) + 1 or len(text)
+        yield text[pos:end]
+        pos = end
+
+def iter_batches(chat_data, batch_size=BATCH_SIZE, day_first=None):
+    # Accepts the whole export as a string or any iterable of lines (e.g. an open text file).
+    # Without a known day order, the first batch decides it for the rest of the stream.
+    lines = iter_lines(chat_data) if isinstance(chat_data, str) else chat_data
+    date_list = []
+    msg_list = []
+    for date_str, msg in iter_messages(lines):
+        date_list.append(date_str)
+        msg_list.append(msg)
+        if len(msg_list) >= batch_size:
+            if day_first is None:
+                day_first = _list_day_first(date_list)
+            yield build_frame(date_list, msg_list, day_first)
+            date_list = []
+            msg_list = []
+    if msg_list:
+        yield build_frame(date_list, msg_list, day_first)
+
+def detect_day_first(first, second):
+    # DD/MM unless the second field ever exceeds 12 while the first never does; ambiguous samples stay DD/MM
+    return not ((second > 12).any() and not (first > 12).any())
+
+def sample_day_first(chat_data):
+    # Headers from evenly spaced windows, so a chat that starts on the 1st-12th of a month still resolves
+    step = max(len(chat_data) // SAMPLE_WINDOWS, SAMPLE_WINDOW_SIZE)
+    fields = []
+    for start in range(0, len(chat_data), step):
+        fields += DATE_ORDER_SAMPLE_PATTERN.findall(chat_data, start, start + SAMPLE_WINDOW_SIZE)
+    if not fields:
+        return True
+    first, second = np.array(fields, dtype=np.int64).T
+    return detect_day_first(first, second)
+
+def _list_day_first(date_list):
+    fields = pc.extract_regex(pa.array(date_list, type=pa.string()), DATE_FIELDS_PATTERN)
+    return detect_day_first(_field(fields, 'first'), _field(fields, 'second'))
+
+def _field(fields, name, default=0):
+    # Digits to int64 (float64 with NaN for rows that are not headers); empty optional groups become default
+    values = fields.field(name)
+    values = pc.if_else(pc.equal(values, ''), str(default), values)
+    return pc.cast(values, pa.int64()).to_numpy(zero_copy_only=False)
+
+def parse_dates(date_list, day_first=None):
+    # Headers -> datetimes: one RE2 pass captures the numeric fields, then the columns are assembled
+    # in bulk. No per-string format parsing; rows that are not a real date/time become NaT.
+    fields = pc.extract_regex(pa.array(date_list, type=pa.string()), DATE_FIELDS_PATTERN)
+    first, second = _field(fields, 'first'), _field(fields, 'second')
+    if day_first is None:
+        day_first = detect_day_first(first, second)
+    day, month = (first, second) if day_first else (second, first)
+    year = _field(fields, 'year')
+    year = np.where(year < 100, year + 2000, year)
+    raw_hour, minute, sec = _field(fields, 'hour'), _field(fields, 'minute'), _field(fields, 'sec')
+    ampm = pc.utf8_lower(fields.field('ampm')).to_numpy(zero_copy_only=False).astype(str)
+    twelve_hour = ampm != ''
+    hour = np.where(twelve_hour, raw_hour % 12 + 12 * (ampm == 'p'), raw_hour)
+    # Out-of-range fields would roll over when assembled ('13:00 pm', '24:10'), so blank them first
+    valid = (~twelve_hour | ((raw_hour >= 1) & (raw_hour <= 12))) & (hour < 24) & (minute < 60) & (sec < 60)
+    parts = pd.DataFrame({'year': year, 'month': month, 'day': day, 'hour': hour, 'minute': minute, 'second': sec})
+    dates = pd.to_datetime(parts[valid].reindex(parts.index), errors='coerce')
+    return dates.astype('datetime64[us]')
+
+def _split_sender(msg_raw):
+    # (users, body after 'user: ' as written, has_user) in one pass over the column
+    parts = msg_raw.str.extract(USER_MSG_PATTERN)
+    has_user = parts['user'].notna()
+    users = parts['user'].where(has_user, 'Group_Message')
+    return users, parts['rest'].where(has_user, msg_raw), has_user
+
+def _join_nested(body, has_user):
+    # Same text as ' '.join(re.split(USER_SPLIT_PATTERN, msg)[2:]); only bodies with a further ': ' change
+    nested = has_user & body.str.contains(': ', regex=False)
+    if not nested.any():
+        return body
+    message = body.copy()
+    message[nested] = message[nested].str.replace(USER_SPLIT_PATTERN, r' \1 ', regex=True)
+    return message
+
+def split_users(msg_raw):
     # Separate user and message
-    user_names = []
-    actual_msgs = []
-    for msg in df['msg_raw']:
-        split_msg = re.split(r'([\w\W]+?): ', msg)
-        if len(split_msg) > 2:
-            user_names.append(split_msg[1])
-            actual_msgs.append(' '.join(split_msg[2:]))
-        else:
-            user_names.append('Group_Message')
-            actual_msgs.append(msg)
-    
-    df['user'] = user_names
-    df['message'] = actual_msgs
-    df.drop(columns=['msg_raw'], inplace=True)
-    
+    users, body, has_user = _split_sender(msg_raw)
+    return users, _join_nested(body, has_user)
+
+def add_date_parts(df):
     # Extract date parts
     df['only_date'] = df['date'].dt.date
     df['year'] = df['date'].dt.year
@@ -44,16 +178,153 @@ def preprocess(chat_data):
     df['day_name'] = df['date'].dt.day_name()
     df['hour'] = df['date'].dt.hour
     df['minute'] = df['date'].dt.minute
-    
+
     # Create period column for heatmap
-    period = []
-    for hour in df['hour']:
-        if hour == 23:
-            period.append(f"{hour:02d}-00")
-        elif hour == 0:
-            period.append(f"00-01")
-        else:
-            period.append(f"{hour:02d}-{hour+1:02d}")
-    df['period'] = period
-    
-    return df
\ No newline at end of file
+    df['period'] = df['hour'].map(PERIOD_LOOKUP)
+    return df
+
+def add_message_flags(df, body=None):
+    # One vectorized pass per class, so stats become column sums: words, links anywhere in the text,
+    # and media / deleted / system flags. Placeholders are matched on the body as written (before
+    # split_users rewrites nested ': ', which turns '<attached: x>' into '<attached x>'), when given.
+    message = df['message']
+    body = message if body is None else body
+    df['word_count'] = message.str.split().str.len().fillna(0).astype('int64')
+    df['url_count'] = message.str.count(URL_PATTERN).fillna(0).astype('int64')
+    df['is_media'] = body.str.fullmatch(MEDIA_PATTERN).fillna(False).astype(bool).to_numpy()
+    df['is_deleted'] = body.str.fullmatch(DELETED_PATTERN).fillna(False).astype(bool).to_numpy()
+    df['is_system'] = df['user'] == 'Group_Message'
+    return df
+
+def build_frame(date_list, msg_list, day_first=None):
+    users, body, has_user = _split_sender(pd.Series(msg_list, dtype=str))
+    message = _join_nested(body, has_user)
+    df = pd.DataFrame({'date': parse_dates(date_list, day_first), 'user': users, 'message': message})
+    return add_message_flags(add_date_parts(df), body)
+
+# ---------------- COMPACT SCHEMA ----------------
+def _small_int(series, dtype):
+    # NaT dates leave NaN date parts, which plain numpy ints cannot hold
+    return series.astype(dtype if series.notna().all() else dtype.capitalize())
+
+def compact_frame(df):
+    # Categoricals for repeated labels, small ints for date parts, Arrow strings for message text
+    df = df.drop(columns=['only_date'])
+    df['user'] = df['user'].astype('category')
+    df['month'] = pd.Categorical(df['month'], categories=MONTH_ORDER)
+    df['day_name'] = pd.Categorical(df['day_name'], categories=DAY_ORDER)
+    df['period'] = pd.Categorical(df['period'], categories=list(PERIOD_LOOKUP.values()))
+    df['year'] = _small_int(df['year'], 'int16')
+    for col in ['month_num', 'day', 'hour', 'minute']:
+        df[col] = _small_int(df[col], 'int8')
+    df['word_count'] = df['word_count'].astype('int32')
+    df['url_count'] = df['url_count'].astype('int16')
+    df['message'] = df['message'].astype('string[pyarrow]')
+    return df
+
+def parse_appended(old, tail, compact=False, on_batch=None, day_first=None):
+    # Rows for text appended to an export already parsed into old, or None when the tail cannot
+    # stand alone: it must open with a dated line and must not go back before the stored messages.
+    # The tail is a string or an iterable of lines; pass the stored chat's day_first, since a short tail
+    # alone ('01/02/25', '01/05/25') cannot tell DD/MM from MM/DD.
+    lines = iter_lines(tail) if isinstance(tail, str) else iter(tail)
+    first = next(lines, '')
+    if not DATE_TIME_PATTERN.match(first):
+        return None
+    new = preprocess(itertools.chain([first], lines), compact=compact, day_first=day_first, on_batch=on_batch)
+    if not old.empty and not new.empty and new['date'].min() < old['date'].max():
+        return None
+    return new
+
+def append_frames(old, new):
+    # Stored frame plus newly parsed rows; concat turns categoricals with different categories
+    # into plain columns, so re-apply the compact user categories afterwards
+    df = pd.concat([old, new], ignore_index=True)
+    if isinstance(old['user'].dtype, pd.CategoricalDtype):
+        df['user'] = df['user'].astype(str).astype('category')
+    return df
+
+# ---------------- PARALLEL PARSING ----------------
+def shard_boundaries(chat_data, num_shards):
+    # Cut points just after a newline that starts a dated line, so no message is split across shards
+    bounds = [0]
+    for i in range(1, num_shards):
+        match = MESSAGE_START_PATTERN.search(chat_data, max(bounds[-1], len(chat_data) * i // num_shards))
+        if match is None:
+            break
+        if match.end() > bounds[-1]:
+            bounds.append(match.end())
+    bounds.append(len(chat_data))
+    return bounds
+
+def _concat_batches(batches):
+    # Compacted batches each have their own user categories; put them on the sorted union first,
+    # which is what compact_frame gives the whole frame, so the column stays categorical
+    if len(batches) == 1:
+        return batches[0]
+    if isinstance(batches[0]['user'].dtype, pd.CategoricalDtype):
+        categories = sorted(set().union(*(batch['user'].cat.categories for batch in batches)))
+        batches = [batch.assign(user=batch['user'].cat.set_categories(categories)) for batch in batches]
+    return pd.concat(batches, ignore_index=True)
+
+def _parse_serial(chat_data, day_first=None, on_batch=None, compact=False):
+    # With compact=True each batch is compacted as soon as it is parsed, so only one raw batch is alive
+    batches = []
+    for batch in iter_batches(chat_data, day_first=day_first):
+        if on_batch is not None:
+            on_batch(batch)
+        batches.append(compact_frame(batch) if compact else batch)
+    if not batches:
+        df = build_frame([], [])
+        return compact_frame(df) if compact else df
+    return _concat_batches(batches)
+
+def _parse_shard(shard, day_first=None, compact=False, on_batch=None):
+    # One shard in a worker process: a str slice of the export, or its UTF-8 bytes, decoded here
+    if isinstance(shard, bytes):
+        shard = shard.decode('utf-8')
+    return _parse_serial(shard, day_first, on_batch, compact)
+
+def parse_shards(shards, day_first=None, on_batch=None, compact=False):
+    # Shards (str, or UTF-8 bytes such as ingest.ChatSource.shards yields) each start at a dated line and
+    # parse independently in worker processes, compacted there when asked; frames come back in file order.
+    # Pass the day order of the whole export so every shard reads dates the same way.
+    shards = list(shards)
+    if len(shards) < 2:
+        return _parse_shard(shards[0] if shards else '', day_first, compact, on_batch)
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        frames = list(pool.map(_parse_shard, shards, [day_first] * len(shards), [compact] * len(shards)))
+    del shards
+    if on_batch is not None:
+        # Callbacks stay in this process and see BATCH_SIZE slices, in file order, as in serial parsing
+        for frame in frames:
+            for start in range(0, len(frame), BATCH_SIZE):
+                on_batch(frame.iloc[start:start + BATCH_SIZE])
+    return _concat_batches(frames)
+
+def parse_parallel(chat_data, workers=None, day_first=None, on_batch=None, compact=False):
+    # A whole export held as a str, cut into one shard per worker
+    workers = workers or os.cpu_count() or 1
+    if day_first is None:
+        day_first = sample_day_first(chat_data)
+    bounds = shard_boundaries(chat_data, workers)
+    return parse_shards((chat_data[start:end] for start, end in zip(bounds, bounds[1:])), day_first, on_batch, compact)
+
+# ---------------- PREPROCESS FUNCTION ----------------
+def preprocess(chat_data, compact=False, workers=None, day_first=None, on_batch=None):
+    # workers=None parses in parallel only for exports above PARALLEL_THRESHOLD; workers=1 forces serial.
+    # Only a str is sharded here; line iterators parse serially (streamed uploads are sharded by byte
+    # range instead, see ingest.parse_source).
+    # Serial parsing is a thin wrapper over iter_batches. Batches are kept (compacted, if asked) until the
+    # final concat, so peak memory is about twice the returned frame plus one raw batch.
+    # on_batch(frame) sees every parsed batch in file order: full schema, before compaction, as it is
+    # produced when serial; BATCH_SIZE slices of the (compacted, if asked) shard frames when parallel.
+    if workers is None:
+        big = isinstance(chat_data, str) and len(chat_data) >= PARALLEL_THRESHOLD
+        workers = os.cpu_count() if big else 1
+    # day_first=None detects DD/MM vs MM/DD from the export itself
+    if day_first is None and isinstance(chat_data, str):
+        day_first = sample_day_first(chat_data)
+    if workers and workers > 1 and isinstance(chat_data, str):
+        return parse_parallel(chat_data, workers, day_first, on_batch, compact)
+    return _parse_serial(chat_data, day_first, on_batch, compact)
@@ -0,0 +1,54 @@
+import re
+import numpy as np
+import pandas as pd
+from utils import normalize_tokens
+
+# Quoted phrases and bare words in a search query
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+# ---------------- INVERTED INDEX ----------------
+class InvertedIndex:
+    # term -> sorted positions of the messages containing it, for the frame the index was built from.
+    # Terms are normalized exactly like the top-words table. Stored CSR-style: the rows for
+    # terms[i] are rows[offsets[i]:offsets[i + 1]].
+    def __init__(self, df):
+        self.messages = df['message']
+        tokens = normalize_tokens(self.messages.reset_index(drop=True))
+        pairs = pd.DataFrame({'term': tokens.to_numpy(), 'row': tokens.index.to_numpy()}).drop_duplicates()
+        codes, terms = pd.factorize(pairs['term'], sort=True)
+        order = np.lexsort((pairs['row'].to_numpy(), codes))
+        self.terms = pd.Index(terms)
+        self.rows = pairs['row'].to_numpy()[order].astype(np.int32)
+        self.offsets = np.searchsorted(codes[order], np.arange(len(terms) + 1))
+
+    def lookup(self, term):
+        if term not in self.terms:
+            return np.zeros(0, dtype=np.int32)
+        i = self.terms.get_loc(term)
+        return self.rows[self.offsets[i]:self.offsets[i + 1]]
+
+    def search(self, query):
+        # Positions of messages containing every word and every "quoted phrase" in the query
+        rows = None
+        for phrase, word in QUERY_PATTERN.findall(query):
+            terms = normalize_tokens(pd.Series([phrase or word], dtype=object)).tolist()
+            for term in terms:
+                matches = self.lookup(term)
+                rows = matches if rows is None else np.intersect1d(rows, matches, assume_unique=True)
+            if phrase and len(terms) > 1 and len(rows):
+                rows = rows[self._has_phrase(rows, terms)]
+        return np.zeros(0, dtype=np.int32) if rows is None else rows
+
+    def _has_phrase(self, rows, terms):
+        # Candidates already contain every term; only they are re-tokenized to check word order
+        tokens = normalize_tokens(self.messages.iloc[rows].reset_index(drop=True))
+        sequences = tokens.groupby(level=0).agg(list).reindex(range(len(rows)))
+        n = len(terms)
+        return np.array([
+            isinstance(seq, list) and any(seq[i:i + n] == terms for i in range(len(seq) - n + 1))
+            for seq in sequences
+        ], dtype=bool)
+
+    def filter(self, df, query):
+        # Rows of df (the frame this index was built from) that match the query
+        return df.iloc[self.search(query)]
@@ -0,0 +1,103 @@
+import copy
+import math
+import os
+import pandas as pd
+from preprocessor import BATCH_SIZE
+from utils import build_emoji_index, build_token_index, top_emojis, top_words, wordcloud_frequencies
+
+OVERALL = "Overall"
+
+# Chats at least this large (MB of text) get approximate top words and emojis in the app
+APPROX_TOP_MB = int(os.environ.get("CHAT_APPROX_MB", "200"))
+# Largest overcount of an approximate count, as a fraction of all words (or emojis) of that user
+APPROX_ERROR = float(os.environ.get("CHAT_APPROX_ERROR", "0.001"))
+
+# ---------------- SPACE-SAVING ----------------
+class SpaceSaving:
+    # Heavy hitters per user (and Overall) in at most `capacity` = ceil(1 / error) entries each.
+    # Batches arrive as exact (user, item) -> count, first indexes, the shape utils builds, and are
+    # merged the Space-Saving way: an item new to a full group enters at that group's smallest count.
+    # Counts never undercount and overcount by at most error x the group's total.
+    def __init__(self, level, error=APPROX_ERROR):
+        self.level = level
+        self.error = error
+        self.capacity = math.ceil(1 / error)
+        self.seen = 0
+        self.entries = pd.DataFrame(
+            {'count': pd.Series(dtype='int64'), 'first': pd.Series(dtype='int64'), 'error': pd.Series(dtype='int64')},
+            index=pd.MultiIndex.from_arrays([[], []], names=['user', level]),
+        )
+
+    def update(self, batch):
+        if batch.empty:
+            return
+        # Positions continue from earlier batches so ties keep first-seen order
+        batch = batch[['count', 'first']].assign(first=batch['first'] + self.seen)
+        self.seen += int(batch['count'].sum())
+        overall = batch.groupby(level=self.level, sort=False).agg(count=('count', 'sum'), first=('first', 'min'))
+        batch = pd.concat([batch, pd.concat({OVERALL: overall}, names=['user'])])
+
+        kept = self.entries['count'].groupby(level='user', sort=False).agg(['size', 'min'])
+        floor = kept['min'].where(kept['size'] >= self.capacity, 0)
+        known = batch.index.isin(self.entries.index)
+        fresh = batch[~known]
+        fresh_floor = floor.reindex(fresh.index.get_level_values('user'), fill_value=0).to_numpy()
+        combined = pd.concat([
+            self.entries,
+            batch[known].assign(error=0),
+            fresh.assign(count=fresh['count'] + fresh_floor, error=fresh_floor),
+        ]).groupby(level=[0, 1], sort=False).agg(count=('count', 'sum'), first=('first', 'min'), error=('error', 'sum'))
+        combined = combined.sort_values(['count', 'first'], ascending=[False, True], kind='stable')
+        rank = combined.groupby(level='user', sort=False).cumcount().to_numpy()
+        self.entries = combined[rank < self.capacity]
+
+    def error_bound(self, user=OVERALL):
+        # Most any count of this user can be too high by: 0 until the user's entries fill up
+        counts = self.entries['count']
+        counts = counts[counts.index.get_level_values('user') == user]
+        return int(counts.min()) if len(counts) >= self.capacity else 0
+
+    def users(self):
+        return set(self.entries.index.get_level_values('user')) - {OVERALL}
+
+# ---------------- TOP WORDS & EMOJIS ----------------
+class TopItemsSketch:
+    # Bounded-memory stand-in for the ChatAggregates word and emoji tables: each parsed batch is
+    # tokenized, counted exactly and folded into the sketches, then dropped. Memory stays at
+    # (users + 1) x capacity entries per sketch, however long the chat.
+    def __init__(self, error=APPROX_ERROR):
+        self.error = error
+        self.words = SpaceSaving('word', error)
+        self.emojis = SpaceSaving('emoji', error)
+
+    @classmethod
+    def from_frame(cls, df, error=APPROX_ERROR, batch_size=BATCH_SIZE):
+        # For frames already parsed (e.g. loaded from the disk cache): same updates, slice by slice
+        sketch = cls(error)
+        for start in range(0, len(df), batch_size):
+            sketch.update(df.iloc[start:start + batch_size])
+        return sketch
+
+    def update(self, df):
+        # One parsed batch, as passed to preprocess(on_batch=...); notifications are skipped
+        if 'is_system' in df:
+            df = df[~df['is_system'].to_numpy(dtype=bool)]
+        self.words.update(build_token_index(df))
+        self.emojis.update(build_emoji_index(df))
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    @property
+    def users(self):
+        return sorted(self.words.users() | self.emojis.users())
+
+    # Same signatures and shapes as the ChatAggregates accessors
+    def most_common_words(self, user=OVERALL, top=50):
+        return top_words(self.words.entries, user, top)
+
+    def word_frequencies(self, user=OVERALL, max_words=200):
+        return wordcloud_frequencies(self.words.entries, user, max_words)
+
+    def emoji_stats(self, user=OVERALL, top=50):
+        return top_emojis(self.emojis.entries, user, top)
@@ -0,0 +1,45 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import Profiler  # noqa: E402
+
+MB = 2 ** 20
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler(track_memory=True)
+    yield profiler
+    profiler.finish()
+
+def _peaks(profiler):
+    return {record['stage']: record['peak_mb'] for record in profiler.records}
+
+def test_parent_peak_covers_earlier_allocations_and_children(profiler):
+    with profiler.stage('outer'):
+        block = bytearray(50 * MB)
+        del block
+        with profiler.stage('inner'):
+            block = bytearray(MB)
+            del block
+    with profiler.stage('parent'):
+        with profiler.stage('child'):
+            block = bytearray(6 * MB)
+            del block
+    peaks = _peaks(profiler)
+    assert 50 <= peaks['outer'] < 51
+    assert 1 <= peaks['inner'] < 2
+    assert peaks['parent'] >= peaks['child'] >= 6
+
+def test_pooled_stages_leave_memory_empty(profiler):
+    with ThreadPoolExecutor(1) as executor:
+        with profiler.stage('main'):
+            executor.submit(profiler.call, 'pooled', lambda: bytearray(3 * MB)).result()
+    peaks = _peaks(profiler)
+    assert peaks['pooled'] is None
+    # The pooled job ran inside the main-thread stage, so it counts there
+    assert peaks['main'] >= 3
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from preprocessor import preprocess  # noqa: E402
+from utils import fetch_most_common_words, fetch_stats  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# (export, flags per message in file order as (is_media, is_deleted))
+SAMPLES = {
+    'ios_chat.txt': [(False, False), (True, False), (False, False), (True, False), (True, False),
+                     (False, True), (False, True), (False, False)],
+    'android_media_chat.txt': [(False, False), (True, False), (True, False), (False, False), (True, False),
+                               (True, False), (False, True), (False, True), (False, False)],
+}
+
+def _parse(name, compact=False):
+    with open(os.path.join(DATA, name), encoding='utf-8') as f:
+        return preprocess(f.read(), compact=compact)
+
+@pytest.mark.parametrize('name', SAMPLES)
+def test_media_and_deleted_flags(name):
+    df = _parse(name)
+    assert list(zip(df['is_media'], df['is_deleted'])) == SAMPLES[name]
+
+@pytest.mark.parametrize('name', SAMPLES)
+def test_placeholders_stay_out_of_stats(name):
+    df = _parse(name, compact=True)
+    df = df[df['user'] != 'Group_Message']
+    media = sum(is_media for is_media, _ in SAMPLES[name])
+    assert fetch_stats(df)[2] == media
+    words = set(fetch_most_common_words(df)['word'])
+    assert words >= {'lovely', 'photo', 'friend'}
+    assert not any('attached' in word or 'omitted' in word or 'deleted' in word for word in words)
+
+def test_nested_colon_rewrite_is_unchanged():
+    # Flags come from the body as written, the message text still follows the original parser
+    df = _parse('ios_chat.txt')
+    assert df['message'].iloc[1] == ' ‎<attached 00000005-PHOTO-2020-05-12-21-15-30.jpg>\n'
+    assert df['message'].iloc[-1] == ' note see you tomorrow\n'
@@ -0,0 +1,72 @@
+import io
+import os
+import sys
+import zipfile
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import ingest  # noqa: E402
+from ingest import ChatSource, parse_source  # noqa: E402
+from preprocessor import DATE_TIME_PATTERN, parse_shards, preprocess  # noqa: E402
+from synthetic_chat import generate_chat  # noqa: E402
+
+# Multi-line messages and emojis, so cuts land next to continuation lines and multi-byte characters
+CHAT = generate_chat(6000, multiline_rate=0.2, emoji_rate=0.5, layout='ios', seed=3)
+
+def _source(kind):
+    data = CHAT.encode('utf-8')
+    if kind == 'zip':
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('WhatsApp Chat with Friends.txt', data)
+            archive.writestr('IMG-20200101-WA0001.jpg', b'\xff\xd8')
+        data = buffer.getvalue()
+    return ChatSource(io.BytesIO(data), f'chat.{kind}')
+
+def _serial(source, compact):
+    return preprocess(source.lines(), compact=compact, workers=1, day_first=source.day_first())
+
+@pytest.mark.parametrize('kind', ['txt', 'zip'])
+@pytest.mark.parametrize('count', [2, 3, 7])
+def test_shard_bounds_start_at_dated_lines(kind, count):
+    source = _source(kind)
+    bounds = source.shard_bounds(count)
+    assert bounds[0] == 0 and bounds[-1] == source.size
+    assert bounds == sorted(set(bounds)) and len(bounds) == count + 1
+    shards = list(source.shards(count))
+    assert b''.join(shards) == CHAT.encode('utf-8')
+    for shard in shards[1:]:
+        assert DATE_TIME_PATTERN.match(shard.decode('utf-8'))
+
+@pytest.mark.parametrize('kind', ['txt', 'zip'])
+@pytest.mark.parametrize('compact', [False, True])
+def test_byte_shards_match_serial(kind, compact):
+    source = _source(kind)
+    batches = []
+    df = parse_shards(source.shards(3), source.day_first(), on_batch=batches.append, compact=compact)
+    expected = _serial(source, compact)
+    pd.testing.assert_frame_equal(df, expected)
+    assert sum(len(batch) for batch in batches) == len(expected)
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_str_shards_match_serial(compact):
+    pd.testing.assert_frame_equal(preprocess(CHAT, compact=compact, workers=3),
+                                  preprocess(CHAT, compact=compact, workers=1))
+
+def test_parse_source_goes_parallel_above_threshold(monkeypatch):
+    source = _source('txt')
+    monkeypatch.setattr(ingest, 'PARALLEL_THRESHOLD', source.size)
+    calls = []
+    monkeypatch.setattr(ingest, 'parse_shards', lambda *args, **kwargs: calls.append(args) or parse_shards(*args, **kwargs))
+    df = parse_source(source, workers=2, compact=True)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(df, _serial(source, True))
+    # Below the threshold the upload streams through the serial parser
+    monkeypatch.setattr(ingest, 'PARALLEL_THRESHOLD', source.size + 1)
+    pd.testing.assert_frame_equal(parse_source(source, workers=2, compact=True), df)
+    assert len(calls) == 1
@@ -0,0 +1,113 @@
+import os
+import random
+import re
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from preprocessor import preprocess, split_users  # noqa: E402
+from synthetic_chat import generate_chat  # noqa: E402
+
+COLUMNS = ['date', 'user', 'message', 'year', 'month_num', 'month', 'day', 'day_name', 'hour', 'minute', 'period']
+
+# ---------------- REFERENCE ----------------
+# The original per-row implementation, kept verbatim as the parity reference
+def reference_preprocess(chat_data):
+    date_time_pattern = r'\d{1,2}/\d{1,2}/\d{2,4},\s*\d{1,2}:\d{2}[  ]?(?i:am|pm)\s*-\s*'
+    msg_list = re.split(date_time_pattern, chat_data)[1:]
+    date_list = re.findall(date_time_pattern, chat_data)
+
+    cleaned_dates = [d.replace(' ', '').replace('am', 'AM').replace('pm', 'PM') for d in date_list]
+
+    df = pd.DataFrame({'msg_raw': msg_list, 'dt_raw': cleaned_dates})
+
+    df['dt_raw'] = pd.to_datetime(df['dt_raw'], format='%d/%m/%Y, %I:%M%p - ', errors='coerce')
+    df.rename(columns={'dt_raw': 'date'}, inplace=True)
+
+    user_names, actual_msgs = reference_split(df['msg_raw'])
+    df['user'] = user_names
+    df['message'] = actual_msgs
+    df.drop(columns=['msg_raw'], inplace=True)
+
+    df['only_date'] = df['date'].dt.date
+    df['year'] = df['date'].dt.year
+    df['month_num'] = df['date'].dt.month
+    df['month'] = df['date'].dt.month_name()
+    df['day'] = df['date'].dt.day
+    df['day_name'] = df['date'].dt.day_name()
+    df['hour'] = df['date'].dt.hour
+    df['minute'] = df['date'].dt.minute
+
+    df['period'] = reference_period(df['hour'])
+    return df
+
+def reference_split(messages):
+    user_names = []
+    actual_msgs = []
+    for msg in messages:
+        split_msg = re.split(r'([\w\W]+?): ', msg)
+        if len(split_msg) > 2:
+            user_names.append(split_msg[1])
+            actual_msgs.append(' '.join(split_msg[2:]))
+        else:
+            user_names.append('Group_Message')
+            actual_msgs.append(msg)
+    return user_names, actual_msgs
+
+def reference_period(hours):
+    period = []
+    for hour in hours:
+        if hour == 23:
+            period.append(f"{hour:02d}-00")
+        elif hour == 0:
+            period.append(f"00-01")
+        else:
+            period.append(f"{hour:02d}-{hour+1:02d}")
+    return period
+
+def _comparable(df):
+    # Same values, same column types: the parser now stores dates at microsecond resolution
+    df = df[COLUMNS].copy()
+    df['date'] = df['date'].astype('datetime64[us]')
+    for col in ['user', 'message', 'month', 'day_name', 'period']:
+        df[col] = df[col].astype(object)
+    return df
+
+# ---------------- FUZZED BODIES ----------------
+PIECES = [': ', ':', ' ', '\n', 'a', 'B', 'x: y', '::', ' : ', '😂', '+92 300: ', '\t', 'é']
+
+def _fuzzed_bodies(count, seed):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 12))) + '\n' for _ in range(count)]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_split_users_matches_reference(seed):
+    raw = _fuzzed_bodies(4000, seed)
+    users, message = split_users(pd.Series(raw, dtype=str))
+    ref_users, ref_messages = reference_split(raw)
+    assert users.tolist() == ref_users
+    assert message.tolist() == ref_messages
+    # Bodies without 'name: ' fall back to Group_Message
+    assert 'Group_Message' in ref_users
+
+@pytest.mark.parametrize('seed', range(3))
+def test_fuzzed_export_matches_reference(seed):
+    rng = random.Random(seed)
+    lines = ["Messages and calls are end-to-end encrypted.\n"]
+    for body in _fuzzed_bodies(3000, seed + 100):
+        # Bodies start with a visible character: the old header pattern also ate leading whitespace
+        lead = rng.choice(['a', 'B', 'x: y', '😂', '+92 300: ', ':'])
+        lines.append(f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2015, 2025)}, "
+                     f"{rng.randint(1, 12)}:{rng.randint(0, 59):02d}\u202f{rng.choice(['am', 'pm'])} - {lead}{body}")
+    chat = ''.join(lines)
+    pd.testing.assert_frame_equal(_comparable(preprocess(chat)), _comparable(reference_preprocess(chat)))
+
+@pytest.mark.parametrize('n_messages, seed', [(2000, 0), (20000, 1)])
+def test_generated_export_matches_reference(n_messages, seed):
+    chat = generate_chat(n_messages, seed=seed)
+    pd.testing.assert_frame_equal(_comparable(preprocess(chat)), _comparable(reference_preprocess(chat)))
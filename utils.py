@@ -1,82 +1,301 @@
-from wordcloud import WordCloud # type: ignore
-from collections import Counter
+from functools import lru_cache
+import logging
+import os
+import re
+import numpy as np
 import pandas as pd
 import emoji # type: ignore
-import streamlit as st # type: ignore
+from preprocessor import URL_DOMAIN_PATTERN, add_message_flags
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stop_words.txt")
+
+MEDIA_MESSAGE = '<Media omitted>\n'
+DELETED_MESSAGE = 'This message was deleted\n'
+WORD_PUNCTUATION = '.,!?()[]{}"\''
+# Same word shape WordCloud keeps when it tokenizes raw text (drops URLs, emojis, single characters)
+CLOUD_WORD_PATTERN = r"\w[\w']+"
+
+# Word cloud output widths (3:2 images) and the canvas size words are laid out on
+WORDCLOUD_WIDTHS = {"Fast": 600, "Balanced": 1200, "Sharp": 2400}
+WORDCLOUD_LAYOUT_WIDTH = 800
+
+# Most points a timeline chart sends to the browser, whatever the chat length
+MAX_CHART_POINTS = 1000
+# Timeline resolutions, finest first, as pandas resample rules (bins start on Mondays / the 1st)
+TIMELINE_RESOLUTIONS = {"Day": "D", "Week": "W-MON", "Month": "MS"}
 
 # ---------------- UTILS FUNCTIONS (Provided) ----------------
+@lru_cache(maxsize=None)
+def load_stop_words():
+    # Read once per process; a frozenset makes the per-word membership test O(1)
+    try:
+        with open(STOP_WORDS_PATH, 'r') as f:
+            return frozenset(f.read().split())
+    except FileNotFoundError:
+        logger.warning("stop_words.txt not found. Proceeding without stop words.")
+        return frozenset()
+
+# ---------------- TOKEN INDEX ----------------
+def normalize_tokens(messages):
+    # Whitespace split, lower-cased, edge punctuation stripped; empty tokens dropped.
+    # Index labels point back at the source messages.
+    tokens = messages.str.split().explode().dropna()
+    tokens = tokens.astype(object).str.lower().str.strip(WORD_PUNCTUATION)
+    return tokens[tokens != '']
+
+def _text_messages(df):
+    # Rows whose words count: the parse-time flags cover every layout (iOS '\u200eimage omitted',
+    # 'You deleted this message'); frames without them fall back to the Android placeholders
+    if {'is_media', 'is_deleted', 'is_system'} <= set(df.columns):
+        return df[~(df['is_media'] | df['is_deleted'] | df['is_system']).to_numpy(dtype=bool)]
+    return df[(df['message'] != MEDIA_MESSAGE) & (df['user'] != 'Group_Message') & (df['message'] != DELETED_MESSAGE)]
+
+def build_token_index(df):
+    # One tokenization pass over the chat: (user, word) -> count and first position.
+    # Shared by the top-words table and the word cloud; 'first' keeps Counter.most_common tie order.
+    temp = _text_messages(df)
+    tokens = normalize_tokens(temp['message'])
+    tokens = tokens[~tokens.isin(load_stop_words())]
+    words = pd.DataFrame({
+        'user': temp['user'].reindex(tokens.index).to_numpy(),
+        'word': tokens.to_numpy(),
+        'pos': np.arange(len(tokens)),
+    })
+    return words.groupby(['user', 'word'], observed=True, sort=False).agg(count=('pos', 'size'), first=('pos', 'min'))
+
+def _top_entries(index, level, user=None, top=50):
+    # user=None sums every user in the index
+    if user is None:
+        entries = index.groupby(level=level, sort=False).agg(count=('count', 'sum'), first=('first', 'min'))
+    elif user in index.index.get_level_values('user'):
+        entries = index.xs(user, level='user')
+    else:
+        entries = index.iloc[:0].droplevel('user')
+    entries = entries.sort_values(['count', 'first'], ascending=[False, True]).head(top)
+    return pd.DataFrame({level: entries.index.to_numpy(), 'count': entries['count'].to_numpy()})
+
+def top_words(token_index, user=None, top=50):
+    return _top_entries(token_index, 'word', user, top)
+
+# ---------------- EMOJI INDEX ----------------
+# Messages joined into one string per regex scan
+EMOJI_SCAN_CHUNK = 100_000
+KEYCAP_BASES = '#*0123456789'
+
+def _trie_regex(sequences):
+    # Prefix-trie alternation: the regex engine rejects non-emoji characters after one branch test
+    trie = {}
+    for seq in sequences:
+        node = trie
+        for char in seq:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def to_regex(node):
+        end = '' in node
+        branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if end else body
+
+    return to_regex(trie)
+
+@lru_cache(maxsize=None)
+def emoji_pattern():
+    # Whole emoji sequences (ZWJ families, skin tones, flags, keycaps); longest match wins
+    return re.compile(_trie_regex(emoji.EMOJI_DATA))
+
+@lru_cache(maxsize=None)
+def emoji_run_pattern():
+    # Cheap character-class scan for stretches that can hold emoji; ASCII only counts as a keycap base
+    # BMP characters compile to a bitmap; astral ones are widened to whole 256-codepoint blocks,
+    # since a long list of astral ranges is tested one by one. The sequence matcher filters the extras.
+    codepoints = set()
+    for seq in emoji.EMOJI_DATA:
+        for char in seq:
+            cp = ord(char)
+            if cp > 0xFFFF:
+                codepoints.update(range(cp & ~0xFF, (cp | 0xFF) + 1))
+            elif cp > 127:
+                codepoints.add(cp)
+    ranges = []
+    for cp in sorted(codepoints):
+        if ranges and cp == ranges[-1][1] + 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    char_class = ''.join(re.escape(chr(lo)) if lo == hi else f'{re.escape(chr(lo))}-{re.escape(chr(hi))}' for lo, hi in ranges)
+    # A bare character class (no leading alternation) lets the regex engine skip ahead quickly
+    return re.compile(f'[{char_class}]+')
+
+def _find_emojis(messages, chunk_size=EMOJI_SCAN_CHUNK):
+    # Scans newline-joined chunks of the column in one regex pass each; returns (row numbers, emoji)
+    run_pattern = emoji_run_pattern()
+    sequence_pattern = emoji_pattern()
+    rows = []
+    found = []
+    for start in range(0, len(messages), chunk_size):
+        chunk = messages[start:start + chunk_size].tolist()
+        lengths = np.fromiter(map(len, chunk), dtype=np.int64, count=len(chunk)) + 1
+        offsets = np.cumsum(lengths) - lengths
+        text = '\n'.join(chunk)
+        positions = []
+        for run in run_pattern.finditer(text):
+            seq = run.group()
+            pos = run.start()
+            # Keycaps (1️⃣, #️⃣) start with an ASCII character the run class leaves out
+            if pos and seq[0] in '\ufe0f\u20e3' and text[pos - 1] in KEYCAP_BASES:
+                seq = text[pos - 1] + seq
+            for match in sequence_pattern.findall(seq):
+                positions.append(pos)
+                found.append(match)
+        rows.append(start + np.searchsorted(offsets, np.array(positions, dtype=np.int64), side='right') - 1)
+    return (np.concatenate(rows) if rows else np.array([], dtype=np.int64)), found
+
+def build_emoji_index(df):
+    # (user, emoji) -> count and first position, without materializing a per-character list
+    rows, found = _find_emojis(df['message'].astype(object).to_numpy())
+    emojis = pd.DataFrame({
+        'user': df['user'].to_numpy()[rows],
+        'emoji': found,
+        'pos': np.arange(len(found)),
+    })
+    return emojis.groupby(['user', 'emoji'], observed=True, sort=False).agg(count=('pos', 'size'), first=('pos', 'min'))
+
+def top_emojis(emoji_index, user=None, top=50):
+    return _top_entries(emoji_index, 'emoji', user, top)
+
+# ---------------- LINK INDEX ----------------
+def build_link_index(df):
+    # (user, domain) -> count and first position; only rows the parser flagged as holding links are read
+    rows = df[df['url_count'] > 0] if 'url_count' in df else df
+    domains = rows['message'].astype(object).str.extractall(URL_DOMAIN_PATTERN)['domain'].str.lower()
+    links = pd.DataFrame({
+        'user': rows['user'].reindex(domains.index.get_level_values(0)).to_numpy(),
+        'domain': domains.to_numpy(),
+        'pos': np.arange(len(domains)),
+    })
+    return links.groupby(['user', 'domain'], observed=True, sort=False).agg(count=('pos', 'size'), first=('pos', 'min'))
+
+def top_domains(link_index, user=None, top=20):
+    return _top_entries(link_index, 'domain', user, top)
+
 def fetch_stats(df):
-    num_messages = df.shape[0]
-    words = df['message'].str.split().apply(len).sum()
-    num_media_messages = df[df['message'] == '<Media omitted>\n'].shape[0]
-    url_list = [i for i in df['message'] if i.startswith('https://') or i.startswith('http://')]
-    num_urls = len(url_list)
-    return num_messages, words, num_media_messages, num_urls
+    # Column sums over the flags preprocess adds; frames built elsewhere get them computed here
+    if 'url_count' not in df:
+        df = add_message_flags(df.copy())
+    return df.shape[0], int(df['word_count'].sum()), int(df['is_media'].sum()), int(df['url_count'].sum())
 
 def fetch_most_active_users(df):
-    top_users = df['user'].value_counts().head(5)
-    user_percentage_df = (df['user'].value_counts(normalize=True) * 100).round(2).reset_index()
+    user_counts = df['user'].value_counts()
+    # Categorical user columns also report users filtered out of df with a count of 0
+    user_counts = user_counts[user_counts > 0]
+    top_users = user_counts.head(5)
+    user_percentage_df = (user_counts / user_counts.sum() * 100).round(2).reset_index()
     user_percentage_df.columns = ['user', 'percentage']
     return top_users, user_percentage_df
 
-def generate_wordcloud(df):
-    try:
-        with open("stop_words.txt", 'r') as f:
-            stop_words = f.read().split()
-    except FileNotFoundError:
-        stop_words = []
-        st.warning("⚠️ stop_words.txt not found. Proceeding without stop words.")
-    df = df[df['message'] != '<Media omitted>\n']
-    messages = df['message'].dropna().astype(str)
-    if not messages.empty:
-        wc = WordCloud(width = 3000, height = 2000, random_state=1, background_color='black', colormap='Set2', collocations=False, stopwords = stop_words)
-        df_wc = wc.generate(' '.join(messages))
-        return df_wc.to_image()
-    return None
+def wordcloud_frequencies(token_index, user=None, max_words=200):
+    words = top_words(token_index, user, top=len(token_index))
+    words = words[words['word'].str.fullmatch(CLOUD_WORD_PATTERN)].head(max_words)
+    return dict(zip(words['word'], words['count']))
+
+def render_wordcloud(frequencies, width=WORDCLOUD_WIDTHS["Balanced"]):
+    if not frequencies:
+        return None
+    # Imported here so headless runs that never draw a cloud skip wordcloud/matplotlib start-up
+    from wordcloud import WordCloud # type: ignore
+    # Lay words out on a small canvas and upscale: layout cost grows with canvas area
+    scale = max(1, width / WORDCLOUD_LAYOUT_WIDTH)
+    layout_width = round(width / scale)
+    wc = WordCloud(width = layout_width, height = round(layout_width * 2 / 3), scale = scale, random_state=1, background_color='black', colormap='Set2', collocations=False)
+    return wc.generate_from_frequencies(frequencies).to_image()
+
+def generate_wordcloud(df, max_words=200, width=WORDCLOUD_WIDTHS["Balanced"]):
+    return render_wordcloud(wordcloud_frequencies(build_token_index(df), max_words=max_words), width)
 
 def fetch_most_common_words(df):
-    temp = df[df['message'] != '<Media omitted>\n']
-    temp = temp[temp['user'] != 'Group_Message']
-    temp = temp[temp['message'] != 'This message was deleted\n']
-    try:
-        with open("stop_words.txt", 'r') as f:
-            stop_words = f.read().split()
-    except FileNotFoundError:
-        stop_words = []
-        st.warning("⚠️ stop_words.txt not found. Proceeding without stop words.")
-    
-    msg = []
-    for message in temp['message']:
-        for word in message.split():
-            i = word.lower().strip('.,!?()[]{}"\'')
-            if i and i not in stop_words:
-                msg.append(i)
-    
-    return pd.DataFrame(Counter(msg).most_common(50), columns=['word', 'count'])
+    return top_words(build_token_index(df))
 
 def fetch_emoji_stats(df):
-    emoji_list = []
-    for msg in df['message']:
-        emoji_list.extend([c for c in msg if c in emoji.EMOJI_DATA])
-    emoji_df = pd.DataFrame(emoji_list, columns=['emoji'])
-    emoji_counts = emoji_df['emoji'].value_counts().reset_index(name='count')
-    emoji_counts.columns = ['emoji', 'count']
-    return emoji_counts.head(50)
+    return top_emojis(build_emoji_index(df))
+
+def fetch_link_stats(df):
+    return top_domains(build_link_index(df))
 
 def monthly_timeline(df):
     if df.empty:
         return pd.DataFrame()
-    timeline = df.groupby(['year', 'month_num', 'month']).count()['message'].reset_index()
+    timeline = df.groupby(['year', 'month_num', 'month'], observed=True)['message'].count().reset_index()
     timeline['time'] = timeline['month'].str[:3] + "-" + timeline['year'].astype(str)
     return timeline
 
 def daily_timeline(df):
     if df.empty:
         return pd.DataFrame()
-    daily_timeline = df.groupby('only_date').count()['message'].reset_index()
+    # Compact frames drop only_date; derive it from the timestamp instead
+    only_date = df['only_date'] if 'only_date' in df else df['date'].dt.normalize().rename('only_date')
+    daily_timeline = df.groupby(only_date)['message'].count().reset_index()
     daily_timeline['only_date'] = pd.to_datetime(daily_timeline['only_date'], errors='coerce')
     return daily_timeline.dropna()
 
+# ---------------- BOUNDED TIMELINES ----------------
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the visual shape
+    # (peaks and dips survive, unlike striding or averaging). First and last points always kept.
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (just the last point for the final bucket)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(areas.argmax())
+        keep[i + 1] = a
+    return keep
+
+def downsample_timeline(timeline, x_col, y_col='message', max_points=MAX_CHART_POINTS):
+    # At most max_points rows; dates are spaced by their real time, other x values by position
+    if len(timeline) <= max_points:
+        return timeline
+    x = timeline[x_col]
+    x = x.astype('int64') if pd.api.types.is_datetime64_any_dtype(x) else np.arange(len(timeline))
+    return timeline.iloc[lttb(x, timeline[y_col].to_numpy(), max_points)]
+
+def resample_timeline(timeline, resolution, date_col='only_date', value_col='message'):
+    # Sum a daily timeline into weeks or months; empty bins become zero
+    if resolution == "Day" or timeline.empty:
+        return timeline
+    counts = timeline.set_index(date_col)[value_col]
+    counts = counts.resample(TIMELINE_RESOLUTIONS[resolution], label='left', closed='left').sum()
+    return counts.rename_axis(date_col).reset_index()
+
+def bounded_timeline(timeline, resolution="Auto", max_points=MAX_CHART_POINTS, date_col='only_date', value_col='message'):
+    # Daily timeline -> (chart-ready frame, resolution used). "Auto" picks the finest resolution
+    # whose bins fit in max_points; whatever is chosen, LTTB caps the result at max_points.
+    if resolution == "Auto":
+        resolution = "Month"
+        if not timeline.empty:
+            span_days = (timeline[date_col].max() - timeline[date_col].min()).days + 1
+            if len(timeline) <= max_points:
+                resolution = "Day"
+            elif span_days / 7 <= max_points:
+                resolution = "Week"
+    resampled = resample_timeline(timeline, resolution, date_col, value_col)
+    return downsample_timeline(resampled, date_col, value_col, max_points), resolution
+
 def week_activity_map(df):
     if df.empty:
         return pd.Series()
@@ -101,7 +320,8 @@ def activity_heatmap(df):
         columns='period',
         values='message',  # Or 'message_id' if messages aren't strings
         aggfunc='count',
-        fill_value=0
+        fill_value=0,
+        observed=True
     )
     # Reorder days
     user_heatmap = user_heatmap.reindex(day_order, fill_value=1)